@@ -0,0 +1,355 @@
+import operator
+import threading
+from contextlib import contextmanager
+from functools import reduce
+
+from django.db.models import Case, Count, F, FloatField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Abs, Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import STATUS_LABELS, Task, TaskCounter, TaskStat, TaskStatus
+
+
+COMPLETED_STATUS = TaskStatus.DONE
+
+# 集計に使うTaskのフィールド
+TASK_FIELDS = (
+    'user_id', 'project_id', 'tab_id', 'status', 'difficulty', 'completion_date', 'scheduled_start_time', 'due_date',
+    'expected_work_time', 'actual_work_time', 'overtime', 'achievement',
+)
+STAT_FIELDS = (
+    'task_count', 'completed_count', 'estimated_count', 'expected_work_time', 'actual_work_time',
+    'estimate_error', 'estimate_abs_error', 'overtime', 'achievement_total', 'achievement_count',
+)
+
+
+def task_values(task, fallback=None):
+    """
+    集計に使う値（読み込まれていないフィールドはfallbackの値を使う。fallbackがなければNone）
+    """
+    deferred = task.get_deferred_fields()
+    if fallback is None and deferred & set(TASK_FIELDS):
+        return None
+    return {name: fallback[name] if name in deferred else getattr(task, name) for name in TASK_FIELDS}
+
+
+def task_contribution(values):
+    """
+    1件のタスクがTaskStatに加える値
+    戻り値: ((user_id, project_id, day, difficulty), {フィールド: 値})
+    """
+    date = values['completion_date'] or values['scheduled_start_time'] or values['due_date']
+    day = timezone.localtime(date).date() if date else None
+    expected, actual = values['expected_work_time'], values['actual_work_time']
+    estimated = expected is not None and actual is not None
+    achievement = values['achievement']
+    deltas = {
+        'task_count': 1,
+        'completed_count': int(values['status'] == COMPLETED_STATUS),
+        'estimated_count': int(estimated),
+        'expected_work_time': expected if estimated else 0,
+        'actual_work_time': actual if estimated else 0,
+        'estimate_error': actual - expected if estimated else 0,
+        'estimate_abs_error': abs(actual - expected) if estimated else 0,
+        'overtime': values['overtime'] or 0,
+        'achievement_total': achievement or 0,
+        'achievement_count': int(achievement is not None),
+    }
+    return (values['user_id'], values['project_id'], day, values['difficulty']), deltas
+
+
+def counter_contribution(values):
+    """
+    1件のタスクがTaskCounterに加える値
+    戻り値: ((project_id, tab_id, status), {フィールド: 値})
+    """
+    return (values['project_id'], values['tab_id'], values['status']), {
+        'task_count': 1,
+        'expected_work_time': values['expected_work_time'] or 0,
+        'actual_work_time': values['actual_work_time'] or 0,
+    }
+
+
+# 差分で更新する集計のモデル: (キーのフィールド, タスク1件の値を返す関数)
+AGGREGATES = {
+    TaskStat: (('user_id', 'project_id', 'day', 'difficulty'), task_contribution),
+    TaskCounter: (('project_id', 'tab_id', 'status'), counter_contribution),
+}
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch_updates():
+    """
+    ブロック内のTaskStat / TaskCounterの更新をキー毎にまとめ、ブロックの最後に実行する（一括操作用）
+    """
+    if getattr(_batch, 'updates', None) is not None:
+        yield
+        return
+    _batch.updates = {}
+    try:
+        yield
+        updates = _batch.updates
+    finally:
+        _batch.updates = None
+    for model in AGGREGATES:
+        model_updates = {key: value for (update_model, key), value in updates.items() if update_model is model}
+        keys = list(model_updates)
+        for start in range(0, len(keys), UPDATE_CHUNK_SIZE):
+            update_stats(model, {key: model_updates[key] for key in keys[start:start + UPDATE_CHUNK_SIZE]})
+
+
+def apply_contribution(model, key, deltas, sign):
+    deltas = {name: value * sign for name, value in deltas.items() if value}
+    updates = getattr(_batch, 'updates', None)
+    if updates is None:
+        update_stat(model, key, deltas, sign > 0)
+        return
+    pending, create, shrink = updates.get((model, key), ({}, False, False))
+    for name, value in deltas.items():
+        pending[name] = pending.get(name, 0) + value
+    updates[(model, key)] = (pending, create or sign > 0, shrink or deltas.get('task_count', 0) < 0)
+
+
+# まとめた更新を1回のUPDATEで行うキーの数（SQLのパラメーター数の上限を超えないようにする）
+UPDATE_CHUNK_SIZE = 100
+
+
+def update_stats(model, updates):
+    """
+    batch_updatesでまとめた更新を行う
+    updatesは {キー: (差分, 行がなければ作成するか, タスク数を減らしたか)}
+    キーの数に関わらず 読み込み・UPDATE・作成・削除 の最大4クエリで済ませる
+    """
+    key_fields = AGGREGATES[model][0]
+    lookups = {key: Q(**dict(zip(key_fields, key))) for key in updates}
+    if not lookups:
+        return
+    # 同時に作成されて行が重複しても合計は変わらないので、最初の1行だけを更新する
+    row_ids = {}
+    for row in model.objects.filter(reduce(operator.or_, lookups.values())).order_by('-id').values('id', *key_fields):
+        row_ids[tuple(row[name] for name in key_fields)] = row['id']
+    changes = {}
+    created = []
+    for key, (deltas, create, _) in updates.items():
+        deltas = {name: value for name, value in deltas.items() if value}
+        if not deltas:
+            continue
+        if key in row_ids:
+            for name, value in deltas.items():
+                changes.setdefault(name, []).append(When(id=row_ids[key], then=F(name) + Value(value)))
+        # 引く行がない場合はプロジェクト・タブの削除などで集計ごと削除されている
+        elif create:
+            created.append(model(**dict(zip(key_fields, key)), **deltas))
+    if changes:
+        model.objects.filter(id__in=row_ids.values()).update(
+            **{name: Case(*whens, default=F(name)) for name, whens in changes.items()})
+    if created:
+        model.objects.bulk_create(created)
+    # タスクがなくなった行は削除する
+    shrunk = [lookups[key] for key, (_, _, shrink) in updates.items() if shrink]
+    if shrunk:
+        model.objects.filter(reduce(operator.or_, shrunk), task_count=0).delete()
+
+
+def update_stat(model, key, deltas, create):
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    lookup = dict(zip(AGGREGATES[model][0], key))
+    # 同時に作成されて行が重複しても合計は変わらないので、最初の1行だけを更新する
+    row = model.objects.filter(**lookup).order_by('id').values('id')[:1]
+    updated = model.objects.filter(id=Subquery(row)).update(**{name: F(name) + value for name, value in deltas.items()})
+    # 引く行がない場合はプロジェクト・タブの削除などで集計ごと削除されている
+    if not updated and create:
+        model.objects.create(**lookup, **deltas)
+    elif deltas.get('task_count', 0) < 0:
+        # タスクがなくなった行は削除する
+        model.objects.filter(**lookup, task_count=0).delete()
+
+
+def remember_task(task):
+    task._stat_values = task_values(task) if task.pk is not None else None
+
+
+def load_task_values(task):
+    # 一部のフィールドだけ読み込んだタスクは保存・削除前にDBから集計用の値を読み込む
+    if task.pk is not None and getattr(task, '_stat_values', None) is None:
+        task._stat_values = Task.objects.filter(pk=task.pk).values(*TASK_FIELDS).first()
+
+
+def task_saved(task, created):
+    old = None if created else getattr(task, '_stat_values', None)
+    new = task_values(task, old)
+    if new is None:
+        return
+    if old == new:
+        return
+    for model, (_, contribution) in AGGREGATES.items():
+        if old is None:
+            apply_contribution(model, *contribution(new), 1)
+            continue
+        old_key, old_deltas = contribution(old)
+        new_key, new_deltas = contribution(new)
+        if old_key == new_key:
+            apply_contribution(model, new_key, {name: new_deltas[name] - old_deltas[name] for name in new_deltas}, 1)
+        else:
+            # タブ・プロジェクトの移動などでキーが変わったら移動元から引いて移動先に足す
+            apply_contribution(model, old_key, old_deltas, -1)
+            apply_contribution(model, new_key, new_deltas, 1)
+    task._stat_values = new
+
+
+def task_deleted(task):
+    values = getattr(task, '_stat_values', None)
+    if values is not None:
+        for model, (_, contribution) in AGGREGATES.items():
+            apply_contribution(model, *contribution(values), -1)
+
+
+def rebuild_task_stats(task_model=Task, stat_model=TaskStat, user_id=None):
+    """
+    タスクから集計をSQLで作り直す（マイグレーション・manage.py rebuild_task_stats用）
+    """
+    tasks = task_model.objects.all()
+    stats = stat_model.objects.all()
+    if user_id is not None:
+        tasks = tasks.filter(user_id=user_id)
+        stats = stats.filter(user_id=user_id)
+    estimated = Q(expected_work_time__isnull=False, actual_work_time__isnull=False)
+    error = F('actual_work_time') - F('expected_work_time')
+    rows = (tasks.annotate(day=TruncDate(Coalesce('completion_date', 'scheduled_start_time', 'due_date')))
+            .values('user_id', 'project_id', 'day', 'difficulty')
+            .annotate(
+                task_count=Count('id'),
+                completed_count=Count('id', filter=Q(status=COMPLETED_STATUS)),
+                estimated_count=Count('id', filter=estimated),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time', filter=estimated), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time', filter=estimated), 0),
+                estimate_error=Coalesce(Sum(error, filter=estimated), 0),
+                estimate_abs_error=Coalesce(Sum(Abs(error), filter=estimated), 0),
+                sum_overtime=Coalesce(Sum('overtime'), 0),
+                achievement_total=Coalesce(Sum('achievement'), Value(0.0), output_field=FloatField()),
+                achievement_count=Count('achievement'),
+            )
+            .order_by())
+    stats.delete()
+    stat_model.objects.bulk_create([
+        stat_model(
+            expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'),
+            overtime=row.pop('sum_overtime'), **row,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+COUNTER_FIELDS = ('task_count', 'expected_work_time', 'actual_work_time')
+
+
+def count_tasks(task_model=Task, user_id=None):
+    """
+    タスクから (project_id, tab_id, status) 毎の合計をSQLで数える
+    """
+    tasks = task_model.objects.all()
+    if user_id is not None:
+        tasks = tasks.filter(user_id=user_id)
+    return (tasks.values('project_id', 'tab_id', 'status')
+            .annotate(
+                task_count=Count('id'),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time'), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time'), 0),
+            )
+            .order_by())
+
+
+def counters_of(counter_model, user_id):
+    counters = counter_model.objects.all()
+    if user_id is not None:
+        counters = counters.filter(project__user_id=user_id)
+    return counters
+
+
+def rebuild_task_counters(task_model=Task, counter_model=TaskCounter, user_id=None):
+    """
+    タスクからタブ・プロジェクトのカウンターをSQLで作り直す（マイグレーション・manage.py rebuild_task_counters用）
+    """
+    rows = count_tasks(task_model, user_id)
+    counters_of(counter_model, user_id).delete()
+    counter_model.objects.bulk_create([
+        counter_model(expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'), **row)
+        for row in rows
+    ], batch_size=500)
+
+
+def verify_task_counters(user_id=None):
+    """
+    カウンターとタスクから数えた値を比べ、違うキーのリストを返す
+    要素は ((project_id, tab_id, status), カウンターの値, タスクから数えた値)。値は (件数, 想定作業時間, 実際の作業時間) で、ない場合はNone
+    """
+    expected = {}
+    for row in count_tasks(user_id=user_id):
+        key = (row['project_id'], row['tab_id'], row['status'])
+        expected[key] = (row['task_count'], row['sum_expected_work_time'], row['sum_actual_work_time'])
+    actual = {}
+    for row in counters_of(TaskCounter, user_id).values('project_id', 'tab_id', 'status', *COUNTER_FIELDS):
+        key = (row['project_id'], row['tab_id'], row['status'])
+        # 同時に作成されて重複した行は合計する
+        values = tuple(row[name] for name in COUNTER_FIELDS)
+        actual[key] = tuple(map(sum, zip(actual[key], values))) if key in actual else values
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=repr):
+        # 件数が0の行は行がないのと同じ
+        counted = actual.get(key) if actual.get(key, (0,))[0] else None
+        if counted != expected.get(key):
+            mismatches.append((key, counted, expected.get(key)))
+    return mismatches
+
+
+def counter_summary(counters):
+    """
+    TaskCounterの行（タブ・プロジェクトの分）を合計する
+    """
+    summary = {name: 0 for name in COUNTER_FIELDS}
+    status_counts = {}
+    for counter in counters:
+        for name in COUNTER_FIELDS:
+            summary[name] += getattr(counter, name)
+        status_counts[counter.status] = status_counts.get(counter.status, 0) + counter.task_count
+    # ステータスはAPIと同じ表示名で返す
+    summary['status_counts'] = {STATUS_LABELS[status]: count for status, count in sorted(status_counts.items()) if count}
+    return summary
+
+
+def stat_metrics(row):
+    """
+    TaskStatの合計からダッシュボード用の値を計算する
+    """
+    def ratio(numerator, denominator):
+        return numerator / denominator if denominator else None
+
+    return {
+        'task_count': row['task_count'],
+        'completed_count': row['completed_count'],
+        'completion_rate': ratio(row['completed_count'], row['task_count']),
+        'overtime': row['overtime'],
+        'average_achievement': ratio(row['achievement_total'], row['achievement_count']),
+        'estimated_count': row['estimated_count'],
+        'expected_work_time': row['expected_work_time'],
+        'actual_work_time': row['actual_work_time'],
+        'mean_estimate_error': ratio(row['estimate_error'], row['estimated_count']),
+        'mean_abs_estimate_error': ratio(row['estimate_abs_error'], row['estimated_count']),
+        'estimate_ratio': ratio(row['actual_work_time'], row['expected_work_time']),
+    }
+
+
+def summarize(stats, group_by=None):
+    """
+    TaskStatをgroup_byのフィールド毎に合計する（Noneなら全体）
+    """
+    sums = {name: Coalesce(Sum(name), 0) for name in STAT_FIELDS if name != 'achievement_total'}
+    sums['achievement_total'] = Coalesce(Sum('achievement_total'), Value(0.0), output_field=FloatField())
+    if group_by is None:
+        return stat_metrics(stats.aggregate(**sums))
+    rows = stats.values(group_by).annotate(**sums).order_by(group_by)
+    return [{group_by: row[group_by], **stat_metrics(row)} for row in rows]
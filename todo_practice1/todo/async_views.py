@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import exceptions
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSetMixin
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+async def get_jwt_user(authentication, validated_token):
+    """
+    JWTAuthentication.get_userの非同期版（ユーザーの取得に非同期ORMを使う）
+    """
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+    try:
+        user = await authentication.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except authentication.user_model.DoesNotExist:
+        raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise exceptions.AuthenticationFailed("The user's password has been changed.", code='password_changed')
+    return user
+
+
+async def authenticate(authenticator, request):
+    # JWTはトークンの検証をそのまま行い、ユーザーの取得だけ非同期にする
+    if not isinstance(authenticator, JWTAuthentication):
+        return await sync_to_async(authenticator.authenticate)(request)
+    header = authenticator.get_header(request)
+    if header is None:
+        return None
+    raw_token = authenticator.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authenticator.get_validated_token(raw_token)
+    if hasattr(authenticator, 'aget_user'):
+        return await authenticator.aget_user(validated_token), validated_token
+    return await get_jwt_user(authenticator, validated_token), validated_token
+
+
+class AsyncReadMixin:
+    """
+    ASYNC_READ_VIEWSが有効なとき、GETをイベントループ上で処理する（ASGIで動かす場合用）
+    - ビューセットは async_list / async_retrieve、APIViewは async_get を定義したものだけが対象
+    - GET以外は従来の同期ビューをスレッドで実行する
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        if issubclass(cls, ViewSetMixin):
+            sync_view = super().as_view(actions, **initkwargs)
+            handler_name = f"async_{actions.get('get')}"
+        else:
+            sync_view = super().as_view(**initkwargs)
+            handler_name = 'async_get'
+        if not settings.ASYNC_READ_VIEWS or not hasattr(cls, handler_name):
+            return sync_view
+
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            if actions is not None:
+                self.action_map = actions
+                self.action = actions['get']
+            return await self.async_dispatch(getattr(self, handler_name), request, *args, **kwargs)
+
+        # cls / initkwargs / actions / csrf_exempt を引き継ぐ
+        view.__dict__.update({key: value for key, value in sync_view.__dict__.items() if key != '__wrapped__'})
+        return view
+
+    # APIView.dispatchの非同期版
+    # 認証だけ先に非同期で行い、残り（コンテンツネゴシエーション・バージョニング・権限・スロットリング）はAPIView.initialに任せる
+    async def async_dispatch(self, handler, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.async_perform_authentication(request)
+            # request.userは設定済みなのでinitialの中では認証し直さない
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    # Request._authenticateの非同期版
+    async def async_perform_authentication(self, request):
+        for authenticator in request.authenticators:
+            try:
+                user_auth = await authenticate(authenticator, request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def async_list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(request, instance)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
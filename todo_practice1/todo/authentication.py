@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    プロセス内でユーザー（user_fieldsの辞書）を保持するLRU（件数の上限と有効期限つき）
+    他のプロセスでの変更はtimeout秒以内に反映される
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        # リクエスト側で変更されても共有しているオブジェクトに影響しないようコピーを返す
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + self.timeout, copy.copy(user))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def shared_key(user_id):
+    return f'todo:auth-user-fields:{user_id}'
+
+
+# キャッシュに載せるフィールド（パスワードのハッシュやメールアドレスは載せない）
+CACHED_USER_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_fields(user):
+    fields = {name: getattr(user, name) for name in CACHED_USER_FIELDS}
+    # トークンの失効の確認用（トークンに入っているのと同じ、パスワードのハッシュのハッシュ）
+    fields['password_hash'] = get_md5_hash_password(user.password)
+    return fields
+
+
+def cached_user(user_model, fields):
+    """
+    キャッシュしたフィールドからユーザーを作る
+    DBから読み込んだのと同じ状態で、それ以外のフィールドは参照した時に読み込まれる（保存しても読み込んだフィールドしか書き込まない）
+    """
+    # from_dbの値はモデルのフィールドの順に並べる
+    names = [field.attname for field in user_model._meta.concrete_fields if field.attname in CACHED_USER_FIELDS]
+    return user_model.from_db(router.db_for_read(user_model), names, [fields[name] for name in names])
+
+
+def _delete_user(user_id):
+    user_cache.delete(user_id)
+    if settings.AUTH_USER_SHARED_CACHE:
+        cache.delete(shared_key(user_id))
+
+
+def invalidate_user(user_id):
+    """
+    ユーザーの変更（パスワード・is_activeなど）をキャッシュに反映する
+    コミット前に他のリクエストが古いユーザーをキャッシュし直さないよう、コミット後にもう一度削除する
+    """
+    _delete_user(user_id)
+    transaction.on_commit(lambda: _delete_user(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    トークンの署名と有効期限を検証したうえで、ユーザーはキャッシュから取得するJWT認証
+    プロセス内のLRU → 共有キャッシュ（AUTH_USER_SHARED_CACHE） → DBの順に探す
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        fields = user_cache.get(user_id)
+        if fields is None and settings.AUTH_USER_SHARED_CACHE:
+            fields = cache.get(shared_key(user_id))
+            if fields is not None:
+                user_cache.set(user_id, fields)
+        if fields is None:
+            user = super().get_user(validated_token)
+            self.cache_user(user_id, user_fields(user))
+            return user
+        self.check_user(fields, validated_token)
+        return cached_user(self.user_model, fields)
+
+    # async_views用（共有キャッシュとDBへのアクセスを非同期で行う）
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        fields = user_cache.get(user_id)
+        if fields is None and settings.AUTH_USER_SHARED_CACHE:
+            fields = await cache.aget(shared_key(user_id))
+            if fields is not None:
+                user_cache.set(user_id, fields)
+        if fields is None:
+            try:
+                user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            fields = user_fields(user)
+            self.check_user(fields, validated_token)
+            user_cache.set(user_id, fields)
+            if settings.AUTH_USER_SHARED_CACHE:
+                await cache.aset(shared_key(user_id), fields, settings.AUTH_USER_SHARED_CACHE_TIMEOUT)
+            return user
+        self.check_user(fields, validated_token)
+        return cached_user(self.user_model, fields)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def cache_user(self, user_id, fields):
+        user_cache.set(user_id, fields)
+        if settings.AUTH_USER_SHARED_CACHE:
+            cache.set(shared_key(user_id), fields, settings.AUTH_USER_SHARED_CACHE_TIMEOUT)
+
+    # JWTAuthentication.get_userのDB取得後の確認と同じ（キャッシュしたフィールドで確認する）
+    def check_user(self, fields, validated_token):
+        if not fields['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != fields['password_hash']:
+                raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# ユーザー毎・プロジェクト毎のデータのバージョン
+# Project / Tab / Task が変わるたびに更新し、一覧・ボードのキャッシュのキーとETagに使う
+# 値は更新時刻（ナノ秒）なので、キャッシュから消えても過去の値と重ならず、Last-Modifiedにも使える
+
+def version_key(user_id):
+    return f'todo:data-version:{user_id}'
+
+
+def project_version_key(project_id):
+    return f'todo:project-version:{project_id}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # 同時に初期化された場合は先に入った値を使う
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _set_version(key):
+    cache.set(key, time.time_ns(), None)
+
+
+def _bump_version(key):
+    """
+    コミット前に他のリクエストが古いデータを新しいバージョンでキャッシュしないよう、コミット後にもう一度更新する
+    """
+    _set_version(key)
+    transaction.on_commit(lambda: _set_version(key))
+
+
+def get_user_version(user_id):
+    return _get_version(version_key(user_id))
+
+
+def get_project_version(project_id):
+    return _get_version(project_version_key(project_id))
+
+
+def bump_user_version(user_id):
+    """
+    ユーザーのデータが変わったことを記録する
+    """
+    if not settings.RESPONSE_CACHE_ENABLED or user_id is None:
+        return
+    _bump_version(version_key(user_id))
+
+
+def bump_project_version(project_id):
+    """
+    プロジェクトとそのタブ・タスクが変わったことを記録する（/api/projects/<id>/board/ のキャッシュ用）
+    """
+    if not settings.RESPONSE_CACHE_ENABLED or project_id is None:
+        return
+    _bump_version(project_version_key(project_id))
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import STATUS_LABELS, Project, Tab, Task
+
+
+# 1回のクエリで取得する件数（メモリに載るのはこの件数分だけ）
+CHUNK_SIZE = 500
+# この大きさまで溜めてから送る（バイト数）
+BUFFER_SIZE = 64 * 1024
+
+# エクスポートする種類とフィールド（親から順に出力するのでこの順に取り込めば外部キーが解決できる）
+EXPORT_FIELDS = {
+    'project': ('id', 'name', 'tree_data', 'tree_version', 'updated_at'),
+    'tab': ('id', 'project', 'name', 'updated_at'),
+    'task': ('id', 'project', 'tab', 'title', 'status', 'purpose', 'background', 'description', 'scheduled_start_time',
+             'due_date', 'actual_start_time', 'completion_date', 'difficulty', 'expected_work_time', 'actual_work_time',
+             'overtime', 'achievement', 'comment', 'updated_at'),
+}
+# 出力時に変換するフィールド（ステータスはAPIと同じ表示名にする）
+EXPORT_CONVERTERS = {'task': {'status': STATUS_LABELS.__getitem__}}
+# CSVは1つの表にまとめる（種類にないフィールドは空）
+CSV_COLUMNS = ('type', *dict.fromkeys(name for fields in EXPORT_FIELDS.values() for name in fields))
+
+
+def export_values(kind, row):
+    """
+    values_listの行をエクスポートする値のdictにする
+    """
+    values = dict(zip(EXPORT_FIELDS[kind], row))
+    for name, convert in EXPORT_CONVERTERS.get(kind, {}).items():
+        values[name] = convert(values[name])
+    return values
+
+
+def export_querysets(user, updated_since=None):
+    projects = Project.objects.filter(user=user)
+    tabs = Tab.objects.filter(project__user=user)
+    tasks = Task.objects.filter(user=user)
+    if updated_since is not None:
+        projects = projects.filter(updated_at__gte=updated_since)
+        tabs = tabs.filter(updated_at__gte=updated_since)
+        tasks = tasks.filter(updated_at__gte=updated_since)
+    return {'project': projects, 'tab': tabs, 'task': tasks}
+
+
+def export_records(user, updated_since=None):
+    """
+    (種類, 値のdict) を Project → Tab → Task の順に1件ずつ返す
+    外部キーは _id を付けない名前にする（APIのシリアライザと同じ）
+    """
+    for kind, queryset in export_querysets(user, updated_since).items():
+        columns = [f'{name}_id' if name in ('project', 'tab') else name for name in EXPORT_FIELDS[kind]]
+        rows = queryset.order_by('id').values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+        for row in rows:
+            yield kind, export_values(kind, row)
+
+
+def ndjson_lines(records):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for kind, values in records:
+        yield encoder.encode({'type': kind, 'data': values}) + '\n'
+
+
+def csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    writer.writerow(CSV_COLUMNS)
+    for kind, values in records:
+        row = [kind]
+        for name in CSV_COLUMNS[1:]:
+            value = values.get(name)
+            if isinstance(value, (dict, list)):
+                value = encoder.encode(value)
+            elif value is not None and not isinstance(value, (str, int, float)):
+                # 日時はNDJSONと同じ形式にする
+                value = encoder.default(value)
+            row.append('' if value is None else value)
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """
+    文字列をまとめてbytesにして返す（1行ずつ送るとオーバーヘッドが大きいため）
+    """
+    chunk, length = [], 0
+    for line in lines:
+        data = line.encode()
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def async_chunks(chunks):
+    """
+    同期のジェネレーターから1チャンクずつスレッドで取り出して返す（ASGI用）
+    ASGIのStreamingHttpResponseは同期のイテレーターを全部読んでから送るので、非同期のイテレーターにして少しずつ送る
+    """
+    chunks = iter(chunks)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+            yield chunk
+    finally:
+        # 途中で切断された場合もクエリのカーソルを閉じる
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # orjsonがない環境では標準ライブラリのjsonを使う
+    orjson = None
+
+
+# 日時はDRFのJSONEncoderで変換する（UTCは末尾をZにするなど、標準のレンダラーと同じ出力にする）
+# Decimalなどorjsonが扱えない型もJSONEncoder.defaultに任せる
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """
+    DRFのJSONRenderer（UNICODE_JSON / COMPACT_JSON）と同じ形式のJSONをbytesで返す
+    orjsonで変換できないもの（64bitを超える整数など）は標準ライブラリで変換する
+    異なるのはfloatの指数表記の書式（1e+16 -> 1e16）とNaN / Infinity（エラーではなくnull）だけ
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def loads(data):
+    """
+    JSON（bytesまたはstr）を読み込む（NaN / Infinityは標準のパーサーと同じくエラー）
+    orjsonで読めないもの（64bitを超える整数など）は標準ライブラリで読み、不正なJSONはそちらでエラーにする
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data, parse_constant=strict_constant)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    orjsonで変換するJSONRenderer（orjsonがない場合やインデント指定時は標準のJSONRendererと同じ処理）
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = dumps(data)
+        # JSONRendererと同じく、JavaScriptの文字列に含められない\u2028 / \u2029はエスケープする
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    orjsonで読み込むJSONParser（UTF-8以外のリクエストは標準のJSONParserと同じ処理）
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8' or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
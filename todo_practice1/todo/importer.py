@@ -0,0 +1,259 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import batch_updates
+from .caching import bump_project_version, bump_user_version
+from .fastjson import loads
+from .models import STATUS_BY_LABEL, Project, Tab, Task
+from .search import batch_index
+from .signals import send_bulk_post_save
+from .tree import node_task_id, sync_tree
+
+
+# 1トランザクションで作成する件数（プロジェクト・タブ・タスクの合計）
+CHUNK_SIZE = 1000
+# 1行の最大バイト数（これより長い行はエラーにして読み飛ばす）
+MAX_LINE_SIZE = 1024 * 1024
+# 結果に含めるエラーの件数の上限（件数はerror_countに全て数える）
+MAX_ERRORS = 100
+
+# 取り込むフィールド（todo.exportの出力と同じ形式、idと外部キーは別に解決する）
+IMPORT_FIELDS = {
+    'project': ('name', 'tree_data'),
+    'tab': ('name',),
+    'task': ('title', 'status', 'purpose', 'background', 'description', 'scheduled_start_time', 'due_date',
+             'actual_start_time', 'completion_date', 'difficulty', 'expected_work_time', 'actual_work_time',
+             'overtime', 'achievement', 'comment'),
+}
+MODELS = {'project': Project, 'tab': Tab, 'task': Task}
+
+
+class LineError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def read_lines(stream, max_size=MAX_LINE_SIZE):
+    """
+    ファイルのようなオブジェクトから1行ずつ読む（全体をメモリに読み込まない）
+    長すぎる行は残りを読み捨ててNoneを返す
+    """
+    while line := stream.readline(max_size + 1):
+        if len(line) > max_size and not line.endswith(b'\n'):
+            while (rest := stream.readline(max_size)) and not rest.endswith(b'\n'):
+                pass
+            yield None
+        else:
+            yield line
+
+
+class TaskImporter:
+    """
+    todo.exportのNDJSON（{"type": "project"|"tab"|"task", "data": {...}}）をユーザーのデータとして取り込む
+    - 親から順に並んでいる前提で、エクスポート時のidと作成したidの対応をメモリに持って参照を解決する
+    - 既存のプロジェクト・タブのidを参照した場合は、ユーザーのものであればそこに追加する
+    - chunk_size件ずつbulk_createし、1チャンクを1トランザクションで保存する
+    - 不正な行は行番号とエラーを記録して読み飛ばす
+    """
+
+    def __init__(self, user, chunk_size=CHUNK_SIZE, progress=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.progress = progress  # チャンクを保存する毎に呼ぶ（引数は途中経過のresult()）
+        self.ids = {kind: {} for kind in MODELS}  # エクスポート時のid -> 作成したid
+        self.failed = {kind: set() for kind in MODELS}  # 取り込めなかった行のエクスポート時のid（参照もエラーにする）
+        self.tab_projects = {}  # 作成したタブ・既存のタブのid -> プロジェクトのid
+        self.pending = {kind: [] for kind in MODELS}  # (行番号, エクスポート時のid, インスタンス, 参照)
+        self.trees = []  # tree_dataのあるプロジェクト（最後にタスクのidを置き換える）
+        self.created = {kind: 0 for kind in MODELS}
+        self.errors = []
+        self.error_count = 0
+        self.lines = 0
+        self.started = time.perf_counter()
+
+    def run(self, lines):
+        for number, line in enumerate(lines, 1):
+            self.lines = number
+            try:
+                if line is None:
+                    raise LineError({'non_field_errors': [f'1行は{MAX_LINE_SIZE}バイト以内にしてください。']})
+                if not line.strip():
+                    continue
+                self.add(number, self.parse(line))
+            except LineError as e:
+                self.add_error(number, e.errors)
+            if sum(len(items) for items in self.pending.values()) >= self.chunk_size:
+                self.flush()
+        self.flush()
+        self.remap_trees()
+        return self.result()
+
+    def parse(self, line):
+        try:
+            record = loads(line)
+        except ValueError:
+            raise LineError({'non_field_errors': ['JSONとして読み込めません。']})
+        if not isinstance(record, dict) or record.get('type') not in MODELS or not isinstance(record.get('data'), dict):
+            raise LineError({'non_field_errors': ['{"type": "project"|"tab"|"task", "data": {...}} の形式で指定してください。']})
+        return record
+
+    def add(self, number, record):
+        kind, data = record['type'], record['data']
+        fields = IMPORT_FIELDS[kind]
+        values = {name: data[name] for name in fields if name in data}
+        if kind == 'task' and 'status' in values:
+            # ステータスはエクスポートと同じ表示名で受け取る
+            if values['status'] not in STATUS_BY_LABEL:
+                self.failed[kind].add(data.get('id'))
+                raise LineError({'status': [f'{", ".join(STATUS_BY_LABEL)} のいずれかを指定してください。']})
+            values['status'] = STATUS_BY_LABEL[values['status']]
+        instance = MODELS[kind](**values)
+        if kind != 'tab':
+            instance.user = self.user
+        # 外部キー以外の値を検証する（型の変換も行われる）
+        exclude = [field.name for field in instance._meta.fields if field.name not in fields]
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            self.failed[kind].add(data.get('id'))
+            raise LineError(e.message_dict)
+        references = {name: data.get(name) for name in ('project', 'tab') if name in data}
+        self.pending[kind].append((number, data.get('id'), instance, references))
+
+    def add_error(self, number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': number, 'errors': errors})
+
+    def resolve(self, kind, value, existing):
+        """
+        参照されたidを作成したidに置き換える（取り込んでいないidは既存のユーザーのものとして扱う）
+        """
+        if value is None or value in self.failed[kind]:
+            return None
+        if value in self.ids[kind]:
+            return self.ids[kind][value]
+        return value if value in existing else None
+
+    def existing_ids(self, kind):
+        # 取り込んだデータで解決できない参照だけ、ユーザーのものか1クエリで確認する
+        values = {references.get(kind) for _, _, _, references in self.pending['tab'] + self.pending['task']}
+        values = {
+            value for value in values
+            if isinstance(value, int) and value not in self.ids[kind] and value not in self.failed[kind]
+        }
+        if not values:
+            return set()
+        if kind == 'project':
+            return set(Project.objects.filter(user=self.user, id__in=values).values_list('id', flat=True))
+        tabs = dict(Tab.objects.filter(project__user=self.user, id__in=values).values_list('id', 'project_id'))
+        self.tab_projects.update(tabs)
+        return set(tabs)
+
+    def flush(self):
+        if not any(self.pending.values()):
+            return
+        # 集計（TaskStat / TaskCounter）と全文検索の索引の更新はタスク毎ではなくまとめて行う
+        with transaction.atomic(), batch_updates(), batch_index():
+            projects = [instance for _, _, instance, _ in self.pending['project']]
+            Project.objects.bulk_create(projects)
+            for number, old_id, instance, _ in self.pending['project']:
+                self.remember('project', old_id, instance.id)
+                if instance.tree_data:
+                    self.trees.append((instance.id, instance.tree_data))
+
+            existing_projects = self.existing_ids('project')
+            tabs = []
+            for number, old_id, instance, references in self.pending['tab']:
+                instance.project_id = self.resolve('project', references.get('project'), existing_projects)
+                if instance.project_id is None:
+                    self.failed['tab'].add(old_id)
+                    self.add_error(number, {'project': ['プロジェクトが見つかりません。']})
+                    continue
+                tabs.append((old_id, instance))
+            Tab.objects.bulk_create([instance for _, instance in tabs])
+            for old_id, instance in tabs:
+                self.remember('tab', old_id, instance.id)
+                self.tab_projects[instance.id] = instance.project_id
+
+            existing_tabs = self.existing_ids('tab')
+            tasks = []
+            for number, old_id, instance, references in self.pending['task']:
+                instance.project_id = self.resolve('project', references.get('project'), existing_projects)
+                instance.tab_id = self.resolve('tab', references.get('tab'), existing_tabs)
+                if instance.project_id is None:
+                    self.add_error(number, {'project': ['プロジェクトが見つかりません。']})
+                    continue
+                if references.get('tab') is not None and self.tab_projects.get(instance.tab_id) != instance.project_id:
+                    self.add_error(number, {'tab': ['タブが見つかりません。']})
+                    continue
+                tasks.append((old_id, instance))
+            new_tasks = [instance for _, instance in tasks]
+            Task.objects.bulk_create(new_tasks)
+            for old_id, instance in tasks:
+                self.remember('task', old_id, instance.id)
+            send_bulk_post_save(Task, new_tasks, created=True)
+
+            if projects or tabs:
+                bump_user_version(self.user.id)
+            # bulk_createしたタブはシグナルを送らないので、既存のプロジェクトのボードのキャッシュを無効にする
+            for project_id in {instance.project_id for _, instance in tabs}:
+                bump_project_version(project_id)
+
+        self.created['project'] += len(projects)
+        self.created['tab'] += len(tabs)
+        self.created['task'] += len(tasks)
+        self.pending = {kind: [] for kind in MODELS}
+        if self.progress:
+            self.progress(self.result())
+
+    def remember(self, kind, old_id, new_id):
+        if old_id is not None:
+            self.ids[kind][old_id] = new_id
+
+    def remap_trees(self):
+        """
+        tree_dataのtaskNodeのid（タスクのid）を取り込んだタスクのidに置き換え、TreeNode / TreeEdgeを同期する
+        """
+        # 元の値が数値なら数値、文字列なら文字列のまま置き換える
+        def replace(value, ids):
+            new_id = ids.get(str(value))
+            if new_id is None:
+                return value
+            return new_id if isinstance(value, int) else str(new_id)
+
+        task_ids = {str(old_id): new_id for old_id, new_id in self.ids['task'].items()}
+        for project_id, tree_data in self.trees:
+            if not isinstance(tree_data, dict):
+                continue
+            node_ids = {}
+            for node in tree_data.get('nodes') or []:
+                if isinstance(node, dict) and node_task_id(node) is not None:
+                    node_ids[str(node['id'])] = task_ids.get(str(node['id']))
+                    node['id'] = replace(node['id'], task_ids)
+            node_ids = {node_id: new_id for node_id, new_id in node_ids.items() if new_id is not None}
+            for edge in tree_data.get('edges') or []:
+                if not isinstance(edge, dict):
+                    continue
+                for end in ('source', 'target'):
+                    edge[end] = replace(edge.get(end), node_ids)
+            with transaction.atomic():
+                Project.objects.filter(id=project_id).update(tree_data=tree_data, updated_at=timezone.now())
+                sync_tree(project_id, self.user.id, tree_data)
+                bump_project_version(project_id)
+        self.trees = []
+
+    def result(self):
+        elapsed = time.perf_counter() - self.started
+        rows = sum(self.created.values())
+        return {
+            'lines': self.lines,
+            'created': dict(self.created),
+            'error_count': self.error_count,
+            'errors': list(self.errors),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed else None,
+        }
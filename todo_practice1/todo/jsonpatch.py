@@ -0,0 +1,119 @@
+import copy
+
+
+# RFC 6902 (JSON Patch) の適用
+# tree_dataの差分更新用。外部ライブラリに依存しないように最低限を実装している
+
+class JsonPatchError(ValueError):
+    pass
+
+
+# testの比較（Pythonの == と違い型も比べる。1とTrue、1と1.0は別の値）
+def json_equal(a, b):
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(json_equal(value, b[key]) for key, value in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+# RFC 6901 (JSON Pointer) をトークンのリストに変換
+def parse_pointer(path):
+    if not isinstance(path, str):
+        raise JsonPatchError(f'pathが不正です: {path!r}')
+    if path == '':
+        return []
+    if not path.startswith('/'):
+        raise JsonPatchError(f'pathは/で始めてください: {path!r}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in path[1:].split('/')]
+
+
+def _list_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchError(f'配列の添字が不正です: {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f'配列の範囲外です: {token!r}')
+    return index
+
+
+def _get(document, tokens):
+    for token in tokens:
+        if isinstance(document, list):
+            document = document[_list_index(document, token)]
+        elif isinstance(document, dict):
+            if token not in document:
+                raise JsonPatchError(f'キーが存在しません: {token!r}')
+            document = document[token]
+        else:
+            raise JsonPatchError(f'参照先がオブジェクト・配列ではありません: {token!r}')
+    return document
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _get(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, key, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise JsonPatchError(f'参照先がオブジェクト・配列ではありません: {key!r}')
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JsonPatchError('ルートは削除できません。')
+    parent = _get(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, key))
+    if isinstance(parent, dict) and key in parent:
+        return parent.pop(key)
+    raise JsonPatchError(f'キーが存在しません: {key!r}')
+
+
+def apply_patch(document, operations):
+    """
+    documentにoperationsを順に適用した結果を返す（documentは書き換えられる）
+    1つでも失敗したらJsonPatchErrorを送出する
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError('operationsはリストで指定してください。')
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JsonPatchError('操作はオブジェクトで指定してください。')
+        op = operation.get('op')
+        path = parse_pointer(operation.get('path'))
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f'{op}にはvalueが必要です。')
+
+        if op == 'add':
+            document = _add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            if path:
+                _remove(document, path)
+            document = _add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            source = parse_pointer(operation.get('from'))
+            if path[:len(source)] == source and path != source:
+                raise JsonPatchError('自身の子孫には移動できません。')
+            document = _add(document, path, _remove(document, source) if source else document)
+        elif op == 'copy':
+            source = parse_pointer(operation.get('from'))
+            document = _add(document, path, copy.deepcopy(_get(document, source)))
+        elif op == 'test':
+            if not json_equal(_get(document, path), operation['value']):
+                raise JsonPatchError(f'testに失敗しました: {operation.get("path")!r}')
+        else:
+            raise JsonPatchError(f'opが不正です: {op!r}')
+    return document
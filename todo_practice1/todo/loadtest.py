@@ -0,0 +1,348 @@
+import math
+import platform
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .analytics import batch_updates
+from .fastjson import dumps
+from .models import OutgoingEmail, Project, Tab, Task, TaskStatus
+from .search import batch_index
+from .signals import send_bulk_post_save
+from .tree import sync_tree
+
+
+SEED_PASSWORD = 'load-test-password'
+# 偏りを付けたステータスの候補（未着手が多い）
+STATUSES = (TaskStatus.NOT_STARTED,) * 3 + (TaskStatus.IN_PROGRESS, TaskStatus.DONE)
+WORDS = ('設計', 'レビュー', '実装', 'テスト', '調査', '資料作成', '打ち合わせ', 'リリース', '修正', '見積もり')
+
+# ベンチマークしないルート（理由）
+SKIPPED_ROUTES = {
+    'task-events': 'Server-Sent Eventsのストリームは終わらないため（ASGIでbenchmark_loadを使う）',
+}
+
+
+def tree_data(task_ids, nodes, rng):
+    """
+    React Flowが保存するものと同じ形のtree_data
+    先頭からタスクのノード（taskNode）を並べ、残りはメモのノードにして、ランダムな親に繋いだ木にする
+    """
+    node_ids = [str(task_id) for task_id in task_ids[:nodes]]
+    node_ids += [f'note-{i}' for i in range(nodes - len(node_ids))]
+    return {
+        'nodes': [
+            {'id': node_id, 'type': 'taskNode' if i < len(task_ids) else 'default',
+             'position': {'x': (i % 40) * 200.0, 'y': (i // 40) * 120.0},
+             'data': {'label': f'ノード{i}', 'collapsed': False}, 'width': 180, 'height': 64}
+            for i, node_id in enumerate(node_ids)
+        ],
+        'edges': [
+            {'id': f'e-{i}', 'source': node_ids[rng.randrange(i)], 'target': node_ids[i], 'type': 'smoothstep'}
+            for i in range(1, len(node_ids))
+        ],
+    }
+
+
+def random_task(user, project, tab, index, base, rng):
+    status = rng.choice(STATUSES)
+    start = base + timedelta(days=rng.randint(-30, 30), minutes=rng.randrange(0, 24 * 60, 15))
+    expected = rng.choice((15, 30, 60, 120, 240))
+    task = Task(
+        user=user, project=project, tab=tab, title=f'{rng.choice(WORDS)}{index}', status=status,
+        purpose=rng.choice((None, '仕様を確定する', '品質を確認する')),
+        description=f'{rng.choice(WORDS)}の手順をまとめる。' * rng.randint(0, 8) or None,
+        scheduled_start_time=start, due_date=start + timedelta(days=rng.randint(1, 14)) if rng.random() < 0.8 else None,
+        difficulty=rng.randint(1, 10), expected_work_time=expected,
+    )
+    if status != TaskStatus.NOT_STARTED:
+        task.actual_start_time = start
+        task.achievement = 100.0 if status == TaskStatus.DONE else float(rng.randrange(0, 100, 5))
+    if status == TaskStatus.DONE:
+        task.actual_work_time = max(expected + rng.randint(-expected // 2, expected), 1)
+        task.overtime = max(task.actual_work_time - expected, 0)
+        task.completion_date = start + timedelta(minutes=task.actual_work_time)
+    return task
+
+
+def seed_users(usernames, rng, projects=5, tabs=3, tasks=20, tree_nodes=200, password=SEED_PASSWORD):
+    """
+    ユーザー毎にプロジェクト・タブ・タスクとtree_dataを作成する（同じrngの種なら同じ内容になる）
+    tasksはタブあたりの件数。集計（TaskStat / TaskCounter）・全文検索の索引・TreeNode / TreeEdgeも作成する
+    戻り値: 作成した件数
+    """
+    base = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    # パスワードのハッシュは1回だけ計算する
+    password = make_password(password)
+    counts = {'users': 0, 'projects': 0, 'tabs': 0, 'tasks': 0, 'tree_nodes': 0}
+    for username in usernames:
+        with transaction.atomic(), batch_updates(), batch_index():
+            user = User.objects.create(username=username, email=f'{username}@example.invalid', password=password)
+            new_projects = Project.objects.bulk_create(
+                Project(user=user, name=f'プロジェクト{i + 1}') for i in range(projects)
+            )
+            new_tabs = Tab.objects.bulk_create(
+                Tab(project=project, name=f'タブ{i + 1}') for project in new_projects for i in range(tabs)
+            )
+            new_tasks = Task.objects.bulk_create(
+                random_task(user, tab.project, tab, i + 1, base, rng) for tab in new_tabs for i in range(tasks)
+            )
+            send_bulk_post_save(Task, new_tasks, created=True)
+            for project in new_projects:
+                task_ids = [task.id for task in new_tasks if task.project_id == project.id]
+                project.tree_data = tree_data(task_ids, tree_nodes, rng)
+                project.tree_version = 1
+                sync_tree(project.id, user.id, project.tree_data)
+            Project.objects.bulk_update(new_projects, ['tree_data', 'tree_version'])
+        counts['users'] += 1
+        counts['projects'] += len(new_projects)
+        counts['tabs'] += len(new_tabs)
+        counts['tasks'] += len(new_tasks)
+        counts['tree_nodes'] += len(new_projects) * tree_nodes
+    return counts
+
+
+class LoadContext:
+    """
+    シナリオが使うユーザーとデータ（ユーザーの最初のプロジェクト・タブ・タスク）
+    """
+
+    def __init__(self, user, password=SEED_PASSWORD):
+        self.user = user
+        self.password = password
+        self.project = Project.objects.filter(user=user).order_by('id').first()
+        self.tab = Tab.objects.filter(project=self.project).order_by('id').first()
+        self.task = Task.objects.filter(user=user).order_by('id').first()
+        if self.project is None or self.tab is None or self.task is None:
+            raise ValueError('プロジェクト・タブ・タスクのあるユーザーを指定してください。')
+        nodes = (self.project.tree_data or {}).get('nodes') or [{'id': str(self.task.id)}]
+        self.root = nodes[0]['id']
+        self.access_token = str(RefreshToken.for_user(user).access_token)
+        self.counter = 0
+
+    def auth(self):
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+    def dataset(self):
+        return {
+            'projects': Project.objects.filter(user=self.user).count(),
+            'tabs': Tab.objects.filter(project__user=self.user).count(),
+            'tasks': Task.objects.filter(user=self.user).count(),
+            'tree_nodes': len((self.project.tree_data or {}).get('nodes') or []),
+        }
+
+
+def get(path, context):
+    return {'method': 'GET', 'path': path, 'headers': context.auth()}
+
+
+def post(path, data, context=None, method='POST', content_type='application/json'):
+    return {
+        'method': method, 'path': path, 'data': data if isinstance(data, bytes) else dumps(data),
+        'content_type': content_type, 'headers': context.auth() if context else {},
+    }
+
+
+def reset_confirm(c):
+    # トークンはパスワードを変えると無効になるので、変更後のユーザーで毎回作る
+    c.user.refresh_from_db()
+    return post('/api/users/reset-password-confirm/', {
+        'uid': urlsafe_base64_encode(force_bytes(c.user.pk)), 'token': default_token_generator.make_token(c.user),
+        'new_password': c.password,
+    })
+
+
+def import_line(c):
+    c.counter += 1
+    line = {'type': 'task', 'data': {'project': c.project.id, 'tab': c.tab.id, 'title': f'取り込み{c.counter}'}}
+    return post('/api/import/', dumps(line) + b'\n', c, content_type='application/x-ndjson')
+
+
+# ルート（URLの名前）毎のリクエスト（LoadContextを受け取り、Client.genericの引数を返す）
+SCENARIOS = {
+    'api-root': lambda c: get('/api/', c),
+    'project-list': lambda c: get('/api/projects/', c),
+    'project-detail': lambda c: get(f'/api/projects/{c.project.id}/', c),
+    'project-board': lambda c: get(f'/api/projects/{c.project.id}/board/', c),
+    'project-save-tree': lambda c: post(f'/api/projects/{c.project.id}/save_tree/', c.project.tree_data, c),
+    'project-tree-nodes': lambda c: get(f'/api/projects/{c.project.id}/tree-nodes/?root={c.root}&depth=3', c),
+    'project-tree-patch': lambda c: get(f'/api/projects/{c.project.id}/tree-patch/?since=0', c),
+    'tab-list': lambda c: get(f'/api/tabs/?project={c.project.id}', c),
+    'tab-detail': lambda c: get(f'/api/tabs/{c.tab.id}/', c),
+    'task-list': lambda c: get(f'/api/tasks/?project={c.project.id}', c),
+    'task-detail': lambda c: get(f'/api/tasks/{c.task.id}/', c),
+    'task-search': lambda c: get('/api/tasks/search/?q=レビュー', c),
+    'task-bulk': lambda c: post('/api/tasks/bulk/', {'update': [{'id': c.task.id, 'achievement': 50}]}, c),
+    'task-notifications': lambda c: get('/api/task-notifications/', c),
+    'analytics': lambda c: get('/api/analytics/', c),
+    'export': lambda c: get('/api/export/', c),
+    'import': import_line,
+    'sync': lambda c: get('/api/sync/?limit=100', c),
+    'health': lambda c: get('/api/health/', c),
+    'user-list': lambda c: get('/api/users/', c),
+    'user-detail': lambda c: get(f'/api/users/{c.user.id}/', c),
+    'user-change-password': lambda c: post('/api/users/change-password/', {
+        'old_password': c.password, 'new_password': c.password,
+    }, c, method='PATCH'),
+    'user-password-reset': lambda c: post('/api/users/password-reset/', {'email': c.user.email}),
+    'user-reset-password-confirm': reset_confirm,
+    'token_obtain_pair': lambda c: post('/api/token/', {'username': c.user.username, 'password': c.password}),
+    'token_refresh': lambda c: post('/api/token/refresh/', {'refresh': str(RefreshToken.for_user(c.user))}),
+    'token_blacklist': lambda c: post('/api/token/blacklist/', {'refresh': str(RefreshToken.for_user(c.user))}),
+    'metrics': lambda c: {
+        'method': 'GET', 'path': '/metrics',
+        'headers': {'Authorization': f'Bearer {settings.METRICS_TOKEN}'} if settings.METRICS_TOKEN else {},
+    },
+}
+
+
+def route_names(patterns=None):
+    """
+    URLconfの名前付きルート（管理画面は除く）
+    """
+    names = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name != 'admin':
+                names |= route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def percentile(values, q):
+    # 最近順位法（件数が少なくても計算できる）
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def send(client, request):
+    request = dict(request)
+    response = client.generic(request.pop('method'), request.pop('path'), **request)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response.status_code
+
+
+def run_benchmark(context, iterations=10, warmup=1, routes=None):
+    """
+    各ルートにiterations回ずつリクエストを送り（プロセス内でDjangoのテストクライアントを使う）、
+    レイテンシのパーセンタイル・リクエストあたりのクエリ数・ピークメモリを返す
+    書き込みのあるルートも読み込みと交互に送る（キャッシュの無効化も含めて計測する）
+    """
+    routes = sorted(routes or SCENARIOS)
+    client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+    samples = {name: {'method': None, 'latency': [], 'queries': [], 'status': {}} for name in routes}
+    # パスワードリセットのメールは送らずにメモリ上に残す
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        for iteration in range(warmup + iterations):
+            for name in routes:
+                request = SCENARIOS[name](context)
+                counter = QueryCounter()
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    status_code = send(client, request)
+                elapsed = time.perf_counter() - started
+                if iteration < warmup:
+                    continue
+                sample = samples[name]
+                sample['method'] = request['method']
+                sample['latency'].append(elapsed)
+                sample['queries'].append(counter.count)
+                sample['status'][str(status_code)] = sample['status'].get(str(status_code), 0) + 1
+
+        # tracemallocは遅くなるので、レイテンシとは別に1回ずつ計測する
+        peaks = {}
+        tracemalloc.start()
+        try:
+            for name in routes:
+                request = SCENARIOS[name](context)
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+                send(client, request)
+                peaks[name] = tracemalloc.get_traced_memory()[1] - current
+        finally:
+            tracemalloc.stop()
+        OutgoingEmail.objects.filter(to=[context.user.email]).delete()
+
+    results = {}
+    for name in routes:
+        sample = samples[name]
+        latency = [value * 1000 for value in sample['latency']]
+        results[name] = {
+            'method': sample['method'],
+            'requests': len(latency),
+            'errors': sum(count for code, count in sample['status'].items() if int(code) >= 400),
+            'status': sample['status'],
+            'latency_ms': {
+                'p50': round(percentile(latency, 50), 3),
+                'p95': round(percentile(latency, 95), 3),
+                'p99': round(percentile(latency, 99), 3),
+                'mean': round(sum(latency) / len(latency), 3),
+                'max': round(max(latency), 3),
+            },
+            'queries': {'mean': round(sum(sample['queries']) / len(latency), 2), 'max': max(sample['queries'])},
+            'peak_memory_kb': round(peaks[name] / 1024, 1),
+        }
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'dataset': context.dataset(),
+        },
+        'routes': results,
+        'skipped': {name: SKIPPED_ROUTES[name] for name in sorted(SKIPPED_ROUTES)},
+    }
+
+
+def compare_results(current, baseline, tolerance=0.25, min_delta_ms=2.0, memory_tolerance=0.5, min_delta_kb=64):
+    """
+    ベースラインより悪くなったルートの説明のリスト（空なら回帰なし）
+    - p95のレイテンシがtolerance（割合）とmin_delta_ms（ミリ秒）の両方を超えて遅くなった
+    - 1リクエストの最大クエリ数が増えた（件数は実行毎に変わらないので許容幅なし）
+    - ピークメモリがmemory_toleranceとmin_delta_kbの両方を超えて増えた
+    - エラー（4xx / 5xx）が増えた、ベースラインにあったルートがない
+    """
+    regressions = []
+    for name, before in sorted(baseline.get('routes', {}).items()):
+        after = current['routes'].get(name)
+        if after is None:
+            regressions.append(f'{name}: 計測結果がありません')
+            continue
+        p95, base_p95 = after['latency_ms']['p95'], before['latency_ms']['p95']
+        if p95 > base_p95 * (1 + tolerance) and p95 - base_p95 > min_delta_ms:
+            regressions.append(f'{name}: p95 {base_p95:.1f}ms -> {p95:.1f}ms')
+        if after['queries']['max'] > before['queries']['max']:
+            regressions.append(f"{name}: クエリ数 {before['queries']['max']} -> {after['queries']['max']}")
+        memory, base_memory = after['peak_memory_kb'], before['peak_memory_kb']
+        if memory > base_memory * (1 + memory_tolerance) and memory - base_memory > min_delta_kb:
+            regressions.append(f'{name}: ピークメモリ {base_memory:.0f}KB -> {memory:.0f}KB')
+        if after['errors'] > before['errors']:
+            regressions.append(f"{name}: エラー {before['errors']} -> {after['errors']} ({after['status']})")
+    return regressions
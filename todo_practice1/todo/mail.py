@@ -0,0 +1,128 @@
+import threading
+import uuid
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+# 1回の送信処理で送る件数
+BATCH_SIZE = 50
+# 送信に失敗したときの再試行（30秒, 1分, 2分, ... と間隔を倍にする）
+MAX_ATTEMPTS = 5
+RETRY_BASE = timezone.timedelta(seconds=30)
+# 取得したメールを他の送信処理が取らないようにしておく時間
+CLAIM_TIMEOUT = timezone.timedelta(minutes=5)
+# 送信待ちがなくても確認する間隔（他プロセスで追加されたもの、再試行待ちのもの）
+POLL_INTERVAL = 60
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """
+    send_mailの代わりにメールを送信待ちにする（SMTPとの通信はリクエストの外で行う）
+    """
+    email = OutgoingEmail.objects.create(subject=subject, body=message, from_email=from_email, to=list(recipient_list))
+    transaction.on_commit(dispatcher.wake)
+    return email
+
+
+def claim_due_emails(now, batch_size=BATCH_SIZE):
+    claim = uuid.uuid4().hex
+    due_ids = list(OutgoingEmail.objects.filter(next_attempt_at__lte=now)
+                   .order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not due_ids:
+        return []
+    # 同時に動いている他の送信処理が先に取ったものは除かれる
+    OutgoingEmail.objects.filter(id__in=due_ids, next_attempt_at__lte=now).update(
+        claim=claim, next_attempt_at=now + CLAIM_TIMEOUT,
+    )
+    return list(OutgoingEmail.objects.filter(claim=claim, sent_at__isnull=True).order_by('id'))
+
+
+def send_queued_mail(batch_size=BATCH_SIZE):
+    """
+    送信待ちのメールを1つのSMTP接続でまとめて送る
+    戻り値: (送信できた件数, 失敗した件数)
+    """
+    sent = failed = 0
+    connection = None
+    try:
+        while True:
+            emails = claim_due_emails(timezone.now(), batch_size)
+            if not emails:
+                break
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, email.from_email, email.to)
+                email.attempts += 1
+                try:
+                    # 接続はバッチをまたいで使い回す
+                    if connection is None:
+                        connection = get_connection()
+                        connection.open()
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed += 1
+                    email.last_error = repr(e)
+                    email.next_attempt_at = (
+                        timezone.now() + RETRY_BASE * 2 ** (email.attempts - 1) if email.attempts < MAX_ATTEMPTS else None
+                    )
+                    # 接続が切れている可能性があるので次のメールは接続し直す
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                else:
+                    sent += 1
+                    email.sent_at = timezone.now()
+                    email.next_attempt_at = None
+                email.claim = ''
+            OutgoingEmail.objects.bulk_update(emails, ['attempts', 'last_error', 'next_attempt_at', 'sent_at', 'claim'])
+    finally:
+        if connection is not None:
+            connection.close()
+    return sent, failed
+
+
+class MailDispatcher:
+    """
+    プロセス内で送信待ちのメールを送るバックグラウンドスレッド
+    queue_mailのコミット後に起こされ、再試行待ちのものはPOLL_INTERVAL毎に確認する
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pending = False
+
+    def wake(self):
+        with self._condition:
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _seconds_until_next(self):
+        next_attempt_at = OutgoingEmail.objects.aggregate(next=Min('next_attempt_at'))['next']
+        if next_attempt_at is None:
+            return POLL_INTERVAL
+        return min(max((next_attempt_at - timezone.now()).total_seconds(), 0), POLL_INTERVAL)
+
+    def _run(self):
+        while True:
+            try:
+                with self._condition:
+                    self._pending = False
+                send_queued_mail()
+                timeout = self._seconds_until_next()
+                close_old_connections()
+            except Exception:
+                timeout = POLL_INTERVAL
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait(timeout)
+
+
+dispatcher = MailDispatcher()
@@ -0,0 +1,100 @@
+import json
+import random
+import uuid
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.analytics import batch_updates
+from todo.loadtest import SCENARIOS, SEED_PASSWORD, SKIPPED_ROUTES, LoadContext, compare_results, route_names, run_benchmark, seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        'urls.pyの全てのルートにプロセス内でリクエストを送り、レイテンシ（p50/p95/p99）・クエリ数・ピークメモリを計測する。'
+        '--outputに結果をJSONで保存し、--baselineのJSONより遅くなったルートがあればエラー終了する（CI用）。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10, help='ルートあたりの計測回数')
+        parser.add_argument('--warmup', type=int, default=1, help='計測前に送る回数（キャッシュなどを温める）')
+        parser.add_argument('--route', action='append', help='計測するルートの名前（複数指定可、既定は全て）')
+        parser.add_argument('--output', help='結果を保存するJSONファイル')
+        parser.add_argument('--baseline', help='比較するJSONファイル（以前の--outputの結果）')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='p95のレイテンシの許容する増加（割合）')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0, help='回帰とみなすp95の最小の差（ミリ秒）')
+        parser.add_argument('--memory-tolerance', type=float, default=0.5, help='ピークメモリの許容する増加（割合）')
+        parser.add_argument('--username', help='seed_loadで作成したユーザー（省略時は一時的なユーザーを作成して最後に削除する）')
+        parser.add_argument('--password', default=SEED_PASSWORD, help='--usernameのユーザーのパスワード')
+        parser.add_argument('--projects', type=int, default=5, help='一時的なユーザーのプロジェクト数')
+        parser.add_argument('--tabs', type=int, default=3, help='プロジェクトあたりのタブ数')
+        parser.add_argument('--tasks', type=int, default=20, help='タブあたりのタスク数')
+        parser.add_argument('--tree-nodes', type=int, default=200, help='プロジェクトあたりのtree_dataのノード数')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+
+    def handle(self, *args, **options):
+        # 新しいルートを追加したらtodo.loadtest.SCENARIOSにも追加する
+        missing = route_names() - set(SCENARIOS) - set(SKIPPED_ROUTES)
+        if missing:
+            raise CommandError(f'シナリオのないルートがあります: {", ".join(sorted(missing))}')
+        routes = options['route'] or None
+        unknown = set(routes or ()) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'不明なルートです: {", ".join(sorted(unknown))}')
+
+        baseline = None
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            if routes:
+                baseline['routes'] = {name: value for name, value in baseline['routes'].items() if name in routes}
+
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"ユーザー {options['username']} がありません（seed_loadで作成してください）。")
+            results = self.run(user, options)
+        else:
+            username = f'benchmark-{uuid.uuid4().hex[:12]}'
+            seed_users(
+                [username], random.Random(options['seed']), projects=options['projects'], tabs=options['tabs'],
+                tasks=options['tasks'], tree_nodes=options['tree_nodes'], password=options['password'],
+            )
+            user = User.objects.get(username=username)
+            try:
+                results = self.run(user, options)
+            finally:
+                # 集計の更新をタスク毎に行わないようにまとめて削除する
+                with batch_updates():
+                    user.delete()
+
+        self.report(results)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, ensure_ascii=False, indent=2) + '\n')
+            self.stdout.write(f"保存しました: {options['output']}")
+        if baseline is not None:
+            regressions = compare_results(
+                results, baseline, tolerance=options['tolerance'], min_delta_ms=options['min_delta_ms'],
+                memory_tolerance=options['memory_tolerance'],
+            )
+            if regressions:
+                raise CommandError('ベースラインより悪くなりました:\n' + '\n'.join(f'  {line}' for line in regressions))
+            self.stdout.write(self.style.SUCCESS(f"ベースライン（{options['baseline']}）からの回帰はありません。"))
+
+    def run(self, user, options):
+        context = LoadContext(user, options['password'])
+        return run_benchmark(context, options['iterations'], options['warmup'], options['route'])
+
+    def report(self, results):
+        meta = results['meta']
+        self.stdout.write(f"database: {meta['database']}  iterations: {meta['iterations']}  dataset: {meta['dataset']}")
+        self.stdout.write(f"{'route':28} {'method':6} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'memory':>9} errors")
+        for name, route in results['routes'].items():
+            latency = route['latency_ms']
+            line = (
+                f"{name:28} {route['method']:6} {latency['p50']:7.1f}ms {latency['p95']:7.1f}ms {latency['p99']:7.1f}ms "
+                f"{route['queries']['max']:8} {route['peak_memory_kb']:7.0f}KB {route['errors']}"
+            )
+            self.stdout.write(self.style.WARNING(line) if route['errors'] else line)
+        for name, reason in results['skipped'].items():
+            self.stdout.write(f'{name:28} 計測しない: {reason}')
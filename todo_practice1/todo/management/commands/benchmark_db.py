@@ -0,0 +1,62 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from todo.models import Project, Task, TaskStatus
+
+
+class Command(BaseCommand):
+    help = (
+        '複数スレッドから同時に書き込んでDBの書き込みスループットを計測する。'
+        'DATABASE_URL / SQLITE_TUNING=0 / DB_POOL_MAX_SIZE を変えて実行すると設定毎に比較できる。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='同時に書き込むスレッド数')
+        parser.add_argument('--writes', type=int, default=200, help='スレッドあたりのトランザクション数')
+
+    def handle(self, *args, **options):
+        threads, writes = options['threads'], options['writes']
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        project = Project.objects.create(user=user, name='benchmark')
+        errors = []
+
+        # 1トランザクションでタスクを作成して更新する（通常のAPIの書き込みに近い処理）
+        def worker():
+            try:
+                for i in range(writes):
+                    try:
+                        with transaction.atomic():
+                            task = Task.objects.create(user=user, project=project, title=f'benchmark {i}')
+                            Task.objects.filter(id=task.id).update(status=TaskStatus.DONE)
+                    except OperationalError as e:
+                        errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        committed = Task.objects.filter(project=project).count()
+        user.delete()
+
+        database = settings.DATABASES['default']
+        self.stdout.write(f"backend: {database['ENGINE']}")
+        if connection.vendor == 'sqlite':
+            self.stdout.write(f'pragmas: {settings.SQLITE_PRAGMAS or "なし"}')
+        else:
+            self.stdout.write(f"pool: {database['OPTIONS'].get('pool', 'なし')}  CONN_MAX_AGE: {database.get('CONN_MAX_AGE')}")
+        self.stdout.write(f'threads: {threads}  transactions: {committed}/{threads * writes}  errors: {len(errors)}')
+        self.stdout.write(self.style.SUCCESS(f'{committed / elapsed:.1f} transactions/sec ({elapsed:.2f}s)'))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'最初のエラー: {errors[0]}'))
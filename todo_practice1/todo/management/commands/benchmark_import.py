@@ -0,0 +1,64 @@
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from todo.analytics import batch_updates
+from todo.importer import CHUNK_SIZE, TaskImporter
+
+
+class Command(BaseCommand):
+    help = (
+        'エクスポートと同じ形式のNDJSONを生成して取り込み、rows/secを計測する（計測用のユーザーは最後に削除する）。'
+        'DATABASE_URLを変えて実行するとSQLiteとPostgreSQLを比較できる。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=10, help='プロジェクト数')
+        parser.add_argument('--tabs', type=int, default=5, help='プロジェクトあたりのタブ数')
+        parser.add_argument('--tasks', type=int, default=2000, help='タブあたりのタスク数')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1トランザクションで作成する件数')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        samples = []
+
+        def progress(result):
+            samples.append((time.perf_counter(), sum(result['created'].values())))
+
+        try:
+            importer = TaskImporter(user, chunk_size=options['chunk_size'], progress=progress)
+            result = importer.run(self.generate(options['projects'], options['tabs'], options['tasks']))
+        finally:
+            # 集計の更新をタスク毎に行わないようにまとめて削除する
+            with batch_updates():
+                user.delete()
+
+        rows = sum(result['created'].values())
+        elapsed = samples[-1][0] - importer.started if samples else 0
+        self.stdout.write(f"backend: {settings.DATABASES['default']['ENGINE']}  chunk size: {options['chunk_size']}")
+        self.stdout.write(f"created: {result['created']}  errors: {result['error_count']}")
+        # 後半のチャンクの速度が落ちていないか（索引や集計の更新で遅くならないか）
+        if len(samples) >= 4:
+            (start, start_rows), (end, end_rows) = samples[len(samples) // 2], samples[-1]
+            self.stdout.write(f'後半: {(end_rows - start_rows) / (end - start):.1f} rows/sec')
+        if elapsed:
+            self.stdout.write(self.style.SUCCESS(f'{rows / elapsed:.1f} rows/sec ({elapsed:.2f}s)'))
+
+    def generate(self, projects, tabs, tasks):
+        task_id = 0
+        for project_id in range(1, projects + 1):
+            yield json.dumps({'type': 'project', 'data': {'id': project_id, 'name': f'project {project_id}', 'tree_data': None}})
+            for tab in range(tabs):
+                tab_id = project_id * tabs + tab
+                yield json.dumps({'type': 'tab', 'data': {'id': tab_id, 'project': project_id, 'name': f'tab {tab}'}})
+                for i in range(tasks):
+                    task_id += 1
+                    yield json.dumps({'type': 'task', 'data': {
+                        'id': task_id, 'project': project_id, 'tab': tab_id, 'title': f'タスク {task_id}',
+                        'status': '完了' if i % 3 == 0 else '未着手', 'description': 'ベンチマーク用のタスク',
+                        'due_date': '2026-01-01T09:00:00Z', 'difficulty': i % 10 + 1, 'expected_work_time': 30,
+                    }})
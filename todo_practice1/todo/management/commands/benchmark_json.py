@@ -0,0 +1,93 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from todo import fastjson
+from todo.models import Project, Tab, Task, TaskStatus
+from todo.serializers import ProjectSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        '標準のJSONRenderer / JSONParserとtodo.fastjson（orjson）の速度を比較する。'
+        'プロジェクト一覧（タスクをネスト）と大きなtree_dataのペイロードをDBを使わずに作って計測する。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=20, help='プロジェクト一覧のプロジェクト数')
+        parser.add_argument('--tasks', type=int, default=50, help='プロジェクトあたりのタスク数')
+        parser.add_argument('--nodes', type=int, default=2000, help='tree_dataのノード数')
+        parser.add_argument('--repeat', type=int, default=20, help='計測の繰り返し回数（最速の値を使う）')
+
+    def handle(self, *args, **options):
+        payloads = {
+            'projects': self.project_list(options['projects'], options['tasks']),
+            'tree_data': self.tree_data(options['nodes']),
+        }
+        if fastjson.orjson is None:
+            self.stdout.write(self.style.WARNING('orjsonがインストールされていないため、標準ライブラリ同士の比較になります。'))
+        for name, data in payloads.items():
+            standard = JSONRenderer().render(data)
+            fast = fastjson.FastJSONRenderer().render(data)
+            self.stdout.write(f'{name}: {len(standard) / 1024:.1f}KB  出力の一致: {"OK" if standard == fast else "NG"}')
+            self.compare('render', options['repeat'], len(standard),
+                         lambda: JSONRenderer().render(data), lambda: fastjson.FastJSONRenderer().render(data))
+            self.compare('parse', options['repeat'], len(standard),
+                         lambda: JSONParser().parse(io.BytesIO(standard)),
+                         lambda: fastjson.FastJSONParser().parse(io.BytesIO(standard)))
+
+    def compare(self, label, repeat, size, standard, fast):
+        standard_time, fast_time = self.measure(standard, repeat), self.measure(fast, repeat)
+        self.stdout.write(
+            f'  {label:6} json: {standard_time * 1000:8.2f}ms ({size / standard_time / 1e6:6.1f}MB/s)  '
+            f'fastjson: {fast_time * 1000:8.2f}ms ({size / fast_time / 1e6:6.1f}MB/s)  '
+            + self.style.SUCCESS(f'x{standard_time / fast_time:.1f}')
+        )
+
+    def measure(self, func, repeat):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    def project_list(self, projects, tasks):
+        # /api/projects/ と同じシリアライザの出力（タスクをネスト、日時は文字列に変換済み）
+        now = timezone.now()
+        instances = []
+        for i in range(projects):
+            project = Project(id=i + 1, name=f'プロジェクト{i}', tree_data=self.tree_data(20), tree_version=i)
+            tab = Tab(id=i + 1, project=project, name='タブ')
+            # project.tasks.all() がDBにアクセスしないようプリフェッチ済みにする
+            project._prefetched_objects_cache = {'tasks': [
+                Task(
+                    id=i * tasks + j + 1, project=project, tab=tab, title=f'タスク{j}の設計とレビュー', status=TaskStatus.NOT_STARTED,
+                    purpose='新しい機能の仕様を確認する', background='前回のリリースで問題があったため',
+                    description='詳細な手順は別のドキュメントにまとめる。' * 3, scheduled_start_time=now + timedelta(hours=j),
+                    due_date=now + timedelta(days=j), difficulty=j % 10 + 1, expected_work_time=60, achievement=j * 1.5,
+                    comment='レビュー待ち',
+                )
+                for j in range(tasks)
+            ]}
+            instances.append(project)
+        return ProjectSerializer(instances, many=True).data
+
+    def tree_data(self, nodes):
+        # フロントエンド（React Flow）が保存するtree_dataと同じ形
+        return {
+            'nodes': [
+                {'id': str(i), 'type': 'taskNode', 'position': {'x': i * 12.5, 'y': (i % 17) * 80.25},
+                 'data': {'label': f'タスク{i}', 'status': '未着手', 'collapsed': False}, 'width': 180, 'height': 64}
+                for i in range(nodes)
+            ],
+            'edges': [
+                {'id': f'e{i // 2}-{i}', 'source': str(i // 2), 'target': str(i), 'type': 'smoothstep', 'animated': False}
+                for i in range(1, nodes)
+            ],
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from todo.models import Project, Tab, Task
+
+
+class Command(BaseCommand):
+    help = (
+        '起動中のサーバーに多数の接続から同時にGETを送り、requests/secとレイテンシ（p50/p95/p99）を計測する。'
+        '同じDBを使うサーバーを同期（gunicorn todo_practice1.wsgi:application）と'
+        '非同期（ASYNC_READ_VIEWS=1 gunicorn -k uvicorn.workers.UvicornWorker todo_practice1.asgi:application）で'
+        '起動してそれぞれ実行すると比較できる。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='サーバーのURL')
+        parser.add_argument('--path', action='append', help='GETするパス（複数指定可、既定はタスク・プロジェクト・タブの一覧と通知）')
+        parser.add_argument('--connections', type=int, default=500, help='同時接続数')
+        parser.add_argument('--requests', type=int, default=10000, help='送信するリクエストの総数')
+        parser.add_argument('--timeout', type=float, default=30, help='1リクエストのタイムアウト（秒）')
+        parser.add_argument('--tasks', type=int, default=200, help='計測用ユーザーに作成するタスク数')
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options['url'])
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError('--url は http://host:port の形式で指定してください。')
+
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        try:
+            project = Project.objects.create(user=user, name='benchmark')
+            tab = Tab.objects.create(project=project, name='benchmark')
+            Task.objects.bulk_create(
+                Task(user=user, project=project, tab=tab, title=f'benchmark {i}') for i in range(options['tasks'])
+            )
+            paths = options['path'] or [
+                '/api/tasks/', f'/api/tasks/?project={project.id}', '/api/projects/', f'/api/tabs/?project={project.id}',
+                '/api/task-notifications/',
+            ]
+            token = str(AccessToken.for_user(user))
+            latencies, errors, elapsed = asyncio.run(self.run_load(
+                parts.hostname, parts.port or 80, paths, token,
+                options['connections'], options['requests'], options['timeout'],
+            ))
+        finally:
+            user.delete()
+
+        self.stdout.write(f"url: {options['url']}  connections: {options['connections']}  paths: {', '.join(paths)}")
+        self.stdout.write(f'requests: {len(latencies)}/{options["requests"]}  errors: {len(errors)}')
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'latency(ms): p50 {quantiles[49] * 1000:.1f}  p95 {quantiles[94] * 1000:.1f}  '
+                f'p99 {quantiles[98] * 1000:.1f}  max {max(latencies) * 1000:.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(latencies) / elapsed:.1f} requests/sec ({elapsed:.2f}s)'))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'最初のエラー: {errors[0]}'))
+
+    async def run_load(self, host, port, paths, token, connections, total, timeout):
+        latencies, errors = [], []
+        remaining = iter(range(total))
+
+        # 接続毎にKeep-Aliveで順番にリクエストを送る（サーバーが閉じたら接続し直す）
+        async def client():
+            stream = None
+            for i in remaining:
+                path = paths[i % len(paths)]
+                started = time.perf_counter()
+                try:
+                    if stream is None:
+                        stream = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                    status, keep_alive = await asyncio.wait_for(self.request(stream, host, path, token), timeout)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                    errors.append(f'{path}: {e!r}')
+                    stream = self.close(stream)
+                    continue
+                if status != 200:
+                    errors.append(f'{path}: HTTP {status}')
+                else:
+                    latencies.append(time.perf_counter() - started)
+                if not keep_alive:
+                    stream = self.close(stream)
+            self.close(stream)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(connections)))
+        return latencies, errors, time.perf_counter() - started
+
+    async def request(self, stream, host, path, token):
+        reader, writer = stream
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n'
+            f'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'.encode()
+        )
+        await writer.drain()
+
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        keep_alive = headers.get('connection') != 'close'
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                await reader.readexactly(size + 2)
+            await reader.readuntil(b'\r\n')
+        else:
+            await reader.read()
+            keep_alive = False
+        return status, keep_alive
+
+    def close(self, stream):
+        if stream is not None:
+            stream[1].close()
+        return None
@@ -0,0 +1,72 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework import serializers
+
+from todo.analytics import batch_updates
+from todo.models import Project, Tab, Task, TaskStatus
+from todo.serializers import TaskSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'タスク一覧のシリアライズを比較する。'
+        'ModelSerializerの通常の処理 / 変換関数を前もって用意した処理（インスタンス） / 同じ処理を.values()の行で行うもの。'
+        '時間はDBからの取得を含む。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, action='append', help='タスク数（複数指定可、既定は1000と10000）')
+        parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数（最速の値を使う）')
+
+    def handle(self, *args, **options):
+        for count in options['tasks'] or [1000, 10000]:
+            user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+            try:
+                self.run(user, count, options['repeat'])
+            finally:
+                # 集計の更新をタスク毎に行わないようにまとめて削除する
+                with batch_updates():
+                    user.delete()
+
+    def run(self, user, count, repeat):
+        project = Project.objects.create(user=user, name='benchmark')
+        tab = Tab.objects.create(project=project, name='benchmark')
+        now = timezone.now()
+        Task.objects.bulk_create(
+            Task(user=user, project=project, tab=tab if i % 2 else None, title=f'タスク{i}', status=TaskStatus.NOT_STARTED,
+                 description='ベンチマーク用のタスク', scheduled_start_time=now, due_date=now if i % 3 else None,
+                 difficulty=i % 10, expected_work_time=30, achievement=i / 7)
+            for i in range(count)
+        )
+        # 結果のキャッシュを使わないよう、毎回.all()で新しく取得する
+        queryset = Task.objects.filter(user=user).order_by('id')
+
+        def generic():
+            serializer = TaskSerializer()
+            return [serializers.ModelSerializer.to_representation(serializer, task) for task in queryset.all()]
+
+        def instances():
+            return TaskSerializer(list(queryset.all()), many=True).data
+
+        def rows():
+            serializer = TaskSerializer()
+            return TaskSerializer(list(queryset.values(*serializer.row_columns())), many=True).data
+
+        results = {name: self.measure(func, repeat) for name, func in
+                   (('ModelSerializer', generic), ('変換関数（インスタンス）', instances), ('変換関数（.values()）', rows))}
+        self.stdout.write(f'{count}件:')
+        baseline = results['ModelSerializer']
+        for name, elapsed in results.items():
+            self.stdout.write(f'  {name:20} {elapsed * 1000:9.1f}ms  ' + self.style.SUCCESS(f'x{baseline / elapsed:.1f}'))
+
+    def measure(self, func, repeat):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+        return min(times)
@@ -0,0 +1,55 @@
+import gzip
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.importer import CHUNK_SIZE, TaskImporter, read_lines
+
+
+class Command(BaseCommand):
+    help = (
+        'エクスポートしたNDJSON（/api/export/ の出力）からプロジェクト・タブ・タスクをユーザーのデータとして取り込む。'
+        '.gzのファイルはそのまま読み込める。-を指定すると標準入力から読む。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSONのファイル（-で標準入力）')
+        parser.add_argument('--user', required=True, help='取り込み先のユーザー名またはID')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1トランザクションで作成する件数')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None and options['user'].isdigit():
+            user = User.objects.filter(id=int(options['user'])).first()
+        if user is None:
+            raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        path = options['path']
+        if path == '-':
+            stream = sys.stdin.buffer
+        elif path.endswith('.gz'):
+            stream = gzip.open(path, 'rb')
+        else:
+            stream = open(path, 'rb')
+
+        importer = TaskImporter(user, chunk_size=options['chunk_size'], progress=self.write_progress)
+        try:
+            result = importer.run(read_lines(stream))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in result['errors']:
+            self.stdout.write(self.style.WARNING(f"{error['line']}行目: {error['errors']}"))
+        if result['error_count'] > len(result['errors']):
+            self.stdout.write(self.style.WARNING(f"ほか{result['error_count'] - len(result['errors'])}件のエラー"))
+        self.write_progress(result)
+        self.stdout.write(self.style.SUCCESS(f"{sum(result['created'].values())}件を取り込みました。"))
+
+    def write_progress(self, result):
+        created = result['created']
+        self.stdout.write(
+            f"{result['lines']}行  project: {created['project']}  tab: {created['tab']}  task: {created['task']}  "
+            f"errors: {result['error_count']}  {result['rows_per_sec']} rows/sec"
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from todo.sync import TOMBSTONE_RETENTION, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = f'保存期間（{TOMBSTONE_RETENTION.days}日）を過ぎた削除の記録（差分同期用）を削除する。cronなどで定期的に実行する。'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'削除した記録: {prune_tombstones()}'))
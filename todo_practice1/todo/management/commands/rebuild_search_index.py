@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from todo.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'タスクの全文検索の索引を作り直す。QuerySet.update()などシグナルを通さずに変更した場合に使う。'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('全文検索の索引を作り直しました。'))
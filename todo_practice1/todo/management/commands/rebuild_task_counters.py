@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from todo.analytics import rebuild_task_counters, verify_task_counters
+
+
+class Command(BaseCommand):
+    help = 'タブ・プロジェクトのタスク数のカウンター（TaskCounter）をタスクから作り直し、一致することを確認する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='対象のユーザーのID（省略すると全ユーザー）')
+        parser.add_argument('--check', action='store_true', help='作り直さずに確認だけ行う（ずれていれば失敗する）')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                rebuild_task_counters(user_id=options['user'])
+            self.stdout.write('カウンターを作り直しました。')
+        mismatches = verify_task_counters(user_id=options['user'])
+        for (project_id, tab_id, status), counted, expected in mismatches:
+            self.stderr.write(f'project={project_id} tab={tab_id} status={status}: カウンター {counted} / タスク {expected}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)}件のカウンターがタスクと一致しません。')
+        self.stdout.write(self.style.SUCCESS('カウンターはタスクと一致しています。'))
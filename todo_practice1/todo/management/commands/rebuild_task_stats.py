@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from todo.analytics import rebuild_task_stats
+
+
+class Command(BaseCommand):
+    help = 'タスクの集計（TaskStat）をタスクから作り直す。QuerySet.update()などシグナルを通さずに変更した場合に使う。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='作り直すユーザーのID（省略すると全ユーザー）')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_task_stats(user_id=options['user'])
+        self.stdout.write(self.style.SUCCESS('タスクの集計を作り直しました。'))
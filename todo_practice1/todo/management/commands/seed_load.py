@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.analytics import batch_updates
+from todo.loadtest import SEED_PASSWORD, seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        '負荷試験用のデータを作成する（ユーザー <prefix>-1 ... とプロジェクト・タブ・タスク・tree_data）。'
+        '--seedが同じなら同じ内容になる。benchmark_api --username や benchmark_load で使う。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='ユーザー数')
+        parser.add_argument('--projects', type=int, default=5, help='ユーザーあたりのプロジェクト数')
+        parser.add_argument('--tabs', type=int, default=3, help='プロジェクトあたりのタブ数')
+        parser.add_argument('--tasks', type=int, default=20, help='タブあたりのタスク数')
+        parser.add_argument('--tree-nodes', type=int, default=200, help='プロジェクトあたりのtree_dataのノード数')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+        parser.add_argument('--prefix', default='load', help='ユーザー名の接頭辞')
+        parser.add_argument('--password', default=SEED_PASSWORD, help='作成するユーザーのパスワード')
+        parser.add_argument('--clear', action='store_true', help='同じ接頭辞のユーザーを削除してから作成する')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        usernames = [f'{prefix}-{i + 1}' for i in range(options['users'])]
+        existing = User.objects.filter(username__startswith=f'{prefix}-')
+        if options['clear']:
+            # 集計の更新をタスク毎に行わないようにまとめて削除する
+            with batch_updates():
+                deleted = existing.delete()[1].get('auth.User', 0)
+            self.stdout.write(f'削除したユーザー: {deleted}')
+        elif existing.filter(username__in=usernames).exists():
+            raise CommandError(f'{prefix}-* のユーザーが既にあります。--clear で削除するか --prefix を変えてください。')
+
+        started = time.perf_counter()
+        counts = seed_users(
+            usernames, random.Random(options['seed']), projects=options['projects'], tabs=options['tabs'],
+            tasks=options['tasks'], tree_nodes=options['tree_nodes'], password=options['password'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS(f'{elapsed:.2f}s'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todo.mail import POLL_INTERVAL, send_queued_mail
+
+
+class Command(BaseCommand):
+    help = '送信待ちのメールを送る（--loopで常駐し、POLL_INTERVAL秒毎に確認する）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='終了せずに送信を続ける')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_mail()
+            if sent or failed:
+                self.stdout.write(f'送信: {sent}件  失敗: {failed}件')
+            if not options['loop']:
+                break
+            time.sleep(POLL_INTERVAL)
@@ -0,0 +1,207 @@
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムのバケット（Prometheusのle）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 処理中のリクエストの計測値（async_viewsのsync_to_asyncの中からも同じものが見える）
+_current = ContextVar('todo_request_metrics', default=None)
+
+
+def sql_shape(sql):
+    """
+    パラメータを除いたSQLの形（IN (%s, %s, ...) は件数によらず同じ形にする）
+    """
+    return re.sub(r'%s(?:\s*,\s*%s)+', '%s', sql)
+
+
+class RequestMetrics:
+    """
+    1リクエストの計測値
+    record_query経由でSQLの件数・時間と形毎の件数を数える
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.shapes = {}
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            shape = sql_shape(sql)
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated_queries(self, threshold):
+        # 同じ形のSQLがthreshold回を超えて実行されたもの（N+1の疑い）
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    全ての接続に設定するexecute_wrapper（todo.signals）
+    DBの接続はスレッド毎なので、処理中のリクエストはcontextvarで探す（sync_to_asyncのスレッドにも引き継がれる）
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@contextmanager
+def collect_request_metrics():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def measure_serialization():
+    """
+    シリアライザのto_representationの時間を足す（ネストしたシリアライザは外側だけ数える）
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._serializing:
+        yield
+        return
+    metrics._serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+        metrics._serializing = False
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    ルート（URLの名前）・メソッド毎のヒストグラムとN+1の件数（プロセス内で集計する）
+    """
+    histograms = {
+        'todo_request_duration_seconds': ('リクエストの処理時間', DURATION_BUCKETS),
+        'todo_request_sql_seconds': ('リクエスト内のSQLの実行時間', DURATION_BUCKETS),
+        'todo_request_serialize_seconds': ('リクエスト内のシリアライズの時間', DURATION_BUCKETS),
+        'todo_request_queries': ('リクエスト内のSQLの件数', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {name: {} for name in self.histograms}
+            self._responses = {}
+            self._n_plus_one = {}
+
+    def observe(self, route, method, status_code, metrics, total):
+        labels = (route, method)
+        values = {
+            'todo_request_duration_seconds': total,
+            'todo_request_sql_seconds': metrics.sql_time,
+            'todo_request_serialize_seconds': metrics.serialize_time,
+            'todo_request_queries': metrics.queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self._histograms[name][labels] = Histogram(self.histograms[name][1])
+                histogram.observe(value)
+            key = (route, method, str(status_code))
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def n_plus_one(self, route, method):
+        with self._lock:
+            self._n_plus_one[(route, method)] = self._n_plus_one.get((route, method), 0) + 1
+
+    def render(self):
+        """
+        Prometheusのテキスト形式
+        """
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in self.histograms.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (route, method), histogram in sorted(self._histograms[name].items()):
+                    labels = f'route="{escape(route)}",method="{method}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.total}')
+            lines += ['# HELP todo_responses_total ステータスコード毎のレスポンス数', '# TYPE todo_responses_total counter']
+            for (route, method, status_code), count in sorted(self._responses.items()):
+                lines.append(f'todo_responses_total{{route="{escape(route)}",method="{method}",status="{status_code}"}} {count}')
+            lines += ['# HELP todo_n_plus_one_total 同じ形のSQLが繰り返されたリクエスト数', '# TYPE todo_n_plus_one_total counter']
+            for (route, method), count in sorted(self._n_plus_one.items()):
+                lines.append(f'todo_n_plus_one_total{{route="{escape(route)}",method="{method}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def record_request(request, response, metrics):
+    """
+    リクエストの計測値を集計し、Server-Timingヘッダーを付ける
+    """
+    total = time.perf_counter() - metrics.started
+    match = getattr(request, 'resolver_match', None)
+    route = (match.view_name or match.route) if match else 'unmatched'
+    registry.observe(route, request.method, response.status_code, metrics, total)
+
+    repeated = metrics.repeated_queries(settings.N_PLUS_ONE_THRESHOLD)
+    if repeated:
+        registry.n_plus_one(route, request.method)
+        for shape, count in repeated.items():
+            logger.warning('N+1の疑い: %s %s で同じSQLが%d回実行されました: %s', request.method, route, count, shape)
+
+    response['Server-Timing'] = metrics.server_timing(total)
+    return response
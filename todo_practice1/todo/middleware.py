@@ -0,0 +1,33 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import collect_request_metrics, record_request
+
+
+class RequestMetricsMiddleware:
+    """
+    リクエスト毎にSQLの件数・時間、シリアライズの時間、全体の処理時間を計測する
+    SQLは接続毎に設定したexecute_wrapper（todo.metrics.record_query）で数える
+    - Server-Timingヘッダーで返す（ブラウザの開発者ツールで見られる）
+    - ルート毎のヒストグラムに集計し、/metrics で返す
+    - 同じ形のSQLがN_PLUS_ONE_THRESHOLD回を超えて実行されたらログに出す
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with collect_request_metrics() as metrics:
+            response = self.get_response(request)
+        return record_request(request, response, metrics)
+
+    async def __acall__(self, request):
+        with collect_request_metrics() as metrics:
+            response = await self.get_response(request)
+        return record_request(request, response, metrics)
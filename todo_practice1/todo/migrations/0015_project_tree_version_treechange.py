@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 05:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0014_task_actual_work_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='tree_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TreeChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('operations', models.JSONField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_changes', to='todo.project')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('project', 'version'), name='unique_tree_change_version')],
+            },
+        ),
+    ]
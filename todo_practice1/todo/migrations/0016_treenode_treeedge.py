@@ -0,0 +1,93 @@
+# Generated by Django 5.1 on 2026-10-18 05:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# todo.tree.tree_rowsのこの時点の内容（後の変更がこのマイグレーションに影響しないようにコピーしている）
+def node_task_id(node):
+    if node.get('type') != 'taskNode':
+        return None
+    try:
+        return int(node['id'])
+    except (TypeError, ValueError):
+        return None
+
+
+def edge_key(edge):
+    if edge.get('id') is not None:
+        return str(edge['id'])
+    return f"{edge.get('source')}->{edge.get('target')}"
+
+
+def tree_rows(tree_data):
+    if not isinstance(tree_data, dict):
+        return {}, {}
+    nodes, edges = {}, {}
+    for node in tree_data.get('nodes') or []:
+        if isinstance(node, dict) and node.get('id') is not None:
+            nodes[str(node['id'])] = (node_task_id(node), node)
+    for edge in tree_data.get('edges') or []:
+        if isinstance(edge, dict) and edge.get('source') is not None and edge.get('target') is not None:
+            edges[edge_key(edge)] = (str(edge['source']), str(edge['target']), edge)
+    return nodes, edges
+
+
+# 既存のtree_dataからTreeNode / TreeEdgeを作成する
+def backfill_tree(apps, schema_editor):
+    Project = apps.get_model('todo', 'Project')
+    Task = apps.get_model('todo', 'Task')
+    TreeNode = apps.get_model('todo', 'TreeNode')
+    TreeEdge = apps.get_model('todo', 'TreeEdge')
+
+    projects = Project.objects.filter(tree_data__isnull=False).only('id', 'user_id', 'tree_data')
+    for project in projects.iterator(chunk_size=100):
+        nodes, edges = tree_rows(project.tree_data)
+        task_ids = {task_id for task_id, _ in nodes.values() if task_id is not None}
+        owned_task_ids = set(Task.objects.filter(user_id=project.user_id, id__in=task_ids).values_list('id', flat=True))
+        TreeNode.objects.bulk_create([
+            TreeNode(project_id=project.id, node_id=node_id, task_id=task_id if task_id in owned_task_ids else None, data=data)
+            for node_id, (task_id, data) in nodes.items()
+        ], batch_size=500)
+        TreeEdge.objects.bulk_create([
+            TreeEdge(project_id=project.id, edge_id=edge_id, source=source, target=target, data=data)
+            for edge_id, (source, target, data) in edges.items()
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0015_project_tree_version_treechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('edge_id', models.CharField(max_length=255)),
+                ('source', models.CharField(max_length=255)),
+                ('target', models.CharField(max_length=255)),
+                ('data', models.JSONField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_edges', to='todo.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'source'], name='tree_edge_source_idx'), models.Index(fields=['project', 'target'], name='tree_edge_target_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TreeNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_id', models.CharField(max_length=255)),
+                ('data', models.JSONField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_nodes', to='todo.project')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tree_nodes', to='todo.task')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('project', 'node_id'), name='unique_tree_node_id')],
+            },
+        ),
+        migrations.RunPython(backfill_tree, migrations.RunPython.noop),
+    ]
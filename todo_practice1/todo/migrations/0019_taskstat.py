@@ -0,0 +1,74 @@
+# Generated by Django 5.1 on 2026-10-18 05:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Abs, Coalesce, TruncDate
+
+
+# 既存のタスクから集計を作成する
+# todo.analytics.rebuild_task_statsのこの時点の内容（後の変更がこのマイグレーションに影響しないようにコピーしている）
+def backfill_task_stats(apps, schema_editor):
+    Task = apps.get_model('todo', 'Task')
+    TaskStat = apps.get_model('todo', 'TaskStat')
+    estimated = Q(expected_work_time__isnull=False, actual_work_time__isnull=False)
+    error = F('actual_work_time') - F('expected_work_time')
+    rows = (Task.objects.annotate(day=TruncDate(Coalesce('completion_date', 'scheduled_start_time', 'due_date')))
+            .values('user_id', 'project_id', 'day', 'difficulty')
+            .annotate(
+                task_count=Count('id'),
+                completed_count=Count('id', filter=Q(status='完了')),
+                estimated_count=Count('id', filter=estimated),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time', filter=estimated), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time', filter=estimated), 0),
+                estimate_error=Coalesce(Sum(error, filter=estimated), 0),
+                estimate_abs_error=Coalesce(Sum(Abs(error), filter=estimated), 0),
+                sum_overtime=Coalesce(Sum('overtime'), 0),
+                achievement_total=Coalesce(Sum('achievement'), Value(0.0), output_field=FloatField()),
+                achievement_count=Count('achievement'),
+            )
+            .order_by())
+    TaskStat.objects.all().delete()
+    TaskStat.objects.bulk_create([
+        TaskStat(
+            expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'),
+            overtime=row.pop('sum_overtime'), **row,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0018_outgoingemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(blank=True, null=True)),
+                ('difficulty', models.IntegerField(blank=True, null=True)),
+                ('task_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('estimated_count', models.IntegerField(default=0)),
+                ('expected_work_time', models.IntegerField(default=0)),
+                ('actual_work_time', models.IntegerField(default=0)),
+                ('estimate_error', models.IntegerField(default=0)),
+                ('estimate_abs_error', models.IntegerField(default=0)),
+                ('overtime', models.IntegerField(default=0)),
+                ('achievement_total', models.FloatField(default=0)),
+                ('achievement_count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to='todo.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='task_stat_user_day_idx'), models.Index(fields=['project', 'day', 'difficulty'], name='task_stat_key_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_task_stats, migrations.RunPython.noop),
+    ]
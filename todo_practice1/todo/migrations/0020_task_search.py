@@ -0,0 +1,100 @@
+# Generated by Django 5.1 on 2026-10-18 06:02
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+# todo.searchのこの時点の内容（後の変更がこのマイグレーションに影響しないようにコピーしている）
+SEARCH_TABLE = 'todo_task_search'
+TEXT_FIELDS = ('title', 'background', 'purpose', 'description', 'comment')
+
+CREATE_SQL = {
+    'sqlite': [
+        f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(title, body, user_id UNINDEXED)',
+    ],
+    'postgresql': [
+        f'CREATE TABLE {SEARCH_TABLE} (task_id bigint PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL)',
+        f'CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)',
+        f'CREATE INDEX {SEARCH_TABLE}_user_idx ON {SEARCH_TABLE} (user_id)',
+    ],
+}
+DROP_SQL = [f'DROP TABLE IF EXISTS {SEARCH_TABLE}']
+
+
+def runs(text):
+    return re.findall(r'[^\W_]+', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def run_tokens(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def document_tokens(text):
+    return [token for run in runs(text) for token in run_tokens(run)]
+
+
+def index_row(values):
+    body = '\n'.join(filter(None, (values[name] for name in TEXT_FIELDS[1:])))
+    return values['id'], values['user_id'], document_tokens(values['title']), document_tokens(body)
+
+
+def postgres_vector(title, body):
+    lexemes = [f"'{token}':{min(i, 16383)}A" for i, token in enumerate(title, 1)]
+    lexemes += [f"'{token}':{min(i, 16383)}" for i, token in enumerate(body, len(title) + 2)]
+    return ' '.join(lexemes)
+
+
+def write_rows(cursor, vendor, rows):
+    if not rows:
+        return
+    if vendor == 'sqlite':
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, user_id, title, body) VALUES (%s, %s, %s, %s)',
+            [(task_id, user_id, ' '.join(title), ' '.join(body)) for task_id, user_id, title, body in rows],
+        )
+    else:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (task_id, user_id, document) VALUES (%s, %s, %s::tsvector)',
+            [(task_id, user_id, postgres_vector(title, body)) for task_id, user_id, title, body in rows],
+        )
+
+
+# 全文検索の索引（SQLiteはFTS5、PostgreSQLはtsvector + GIN）を作成し、既存のタスクを索引する
+# それ以外のデータベースは索引を作らない（検索はLIKEで行う）
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    Task = apps.get_model('todo', 'Task')
+    for sql in DROP_SQL + CREATE_SQL[vendor]:
+        schema_editor.execute(sql)
+    tasks = Task.objects.using(schema_editor.connection.alias).values('id', 'user_id', *TEXT_FIELDS).order_by('id')
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for task in tasks.iterator(chunk_size=500):
+            rows.append(index_row(task))
+            if len(rows) >= 500:
+                write_rows(cursor, vendor, rows)
+                rows = []
+        write_rows(cursor, vendor, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0019_taskstat'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
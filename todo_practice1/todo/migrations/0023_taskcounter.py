@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+# 既存のタスクからカウンターを作成する
+# todo.analytics.rebuild_task_countersのこの時点の内容（後の変更がこのマイグレーションに影響しないようにコピーしている）
+def backfill_task_counters(apps, schema_editor):
+    Task = apps.get_model('todo', 'Task')
+    TaskCounter = apps.get_model('todo', 'TaskCounter')
+    rows = (Task.objects.values('project_id', 'tab_id', 'status')
+            .annotate(
+                task_count=Count('id'),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time'), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time'), 0),
+            )
+            .order_by())
+    TaskCounter.objects.all().delete()
+    TaskCounter.objects.bulk_create([
+        TaskCounter(expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'), **row)
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0022_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=10)),
+                ('task_count', models.IntegerField(default=0)),
+                ('expected_work_time', models.IntegerField(default=0)),
+                ('actual_work_time', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_counters', to='todo.project')),
+                ('tab', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='task_counters', to='todo.tab')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'tab', 'status'], name='task_counter_key_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_task_counters, migrations.RunPython.noop),
+    ]
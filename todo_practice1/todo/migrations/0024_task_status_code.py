@@ -0,0 +1,139 @@
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Abs, Coalesce, TruncDate
+
+
+# 変換前の表示名とステータスの値（todo.models.TaskStatusと同じ）
+LEGACY_STATUSES = {'未着手': 0, '進行中': 1, '完了': 2}
+STATUS_CHOICES = [(0, '未着手'), (1, '進行中'), (2, '完了')]
+
+
+# 文字列のステータスを整数にする
+# 前後の空白は無視し、どれにも当たらない値（入力ミスなど）は未着手にする
+def convert_statuses(apps, schema_editor):
+    Task = apps.get_model('todo', 'Task')
+    for status in list(Task.objects.values_list('status', flat=True).distinct()):
+        code = LEGACY_STATUSES.get((status or '').strip(), 0)
+        Task.objects.filter(status=status).update(status_code=code)
+
+
+def restore_statuses(apps, schema_editor):
+    Task = apps.get_model('todo', 'Task')
+    for code, label in STATUS_CHOICES:
+        Task.objects.filter(status_code=code).update(status=label)
+
+
+# todo.analytics.rebuild_task_stats / rebuild_task_countersのこの時点の内容（後の変更がこのマイグレーションに影響しないようにコピーしている）
+def rebuild_task_stats(Task, TaskStat):
+    estimated = Q(expected_work_time__isnull=False, actual_work_time__isnull=False)
+    error = F('actual_work_time') - F('expected_work_time')
+    rows = (Task.objects.annotate(day=TruncDate(Coalesce('completion_date', 'scheduled_start_time', 'due_date')))
+            .values('user_id', 'project_id', 'day', 'difficulty')
+            .annotate(
+                task_count=Count('id'),
+                completed_count=Count('id', filter=Q(status=LEGACY_STATUSES['完了'])),
+                estimated_count=Count('id', filter=estimated),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time', filter=estimated), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time', filter=estimated), 0),
+                estimate_error=Coalesce(Sum(error, filter=estimated), 0),
+                estimate_abs_error=Coalesce(Sum(Abs(error), filter=estimated), 0),
+                sum_overtime=Coalesce(Sum('overtime'), 0),
+                achievement_total=Coalesce(Sum('achievement'), Value(0.0), output_field=FloatField()),
+                achievement_count=Count('achievement'),
+            )
+            .order_by())
+    TaskStat.objects.all().delete()
+    TaskStat.objects.bulk_create([
+        TaskStat(
+            expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'),
+            overtime=row.pop('sum_overtime'), **row,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+# statusは整数・文字列のどちらでも同じ（そのままキーにする）
+def rebuild_task_counters(Task, TaskCounter):
+    rows = (Task.objects.values('project_id', 'tab_id', 'status')
+            .annotate(
+                task_count=Count('id'),
+                sum_expected_work_time=Coalesce(Sum('expected_work_time'), 0),
+                sum_actual_work_time=Coalesce(Sum('actual_work_time'), 0),
+            )
+            .order_by())
+    TaskCounter.objects.all().delete()
+    TaskCounter.objects.bulk_create([
+        TaskCounter(expected_work_time=row.pop('sum_expected_work_time'), actual_work_time=row.pop('sum_actual_work_time'), **row)
+        for row in rows
+    ], batch_size=500)
+
+
+# 変換後の値で集計とカウンターを作り直す（入力ミスなどをまとめた分だけ変わる）
+def rebuild_aggregates(apps, schema_editor):
+    Task = apps.get_model('todo', 'Task')
+    rebuild_task_stats(Task, apps.get_model('todo', 'TaskStat'))
+    rebuild_task_counters(Task, apps.get_model('todo', 'TaskCounter'))
+
+
+# カウンターは最後に作り直すので、ステータスの列を作り直す前に空にする
+def clear_counters(apps, schema_editor):
+    apps.get_model('todo', 'TaskCounter').objects.all().delete()
+
+
+# 戻す場合は文字列に戻した後でカウンターを作り直す
+def rebuild_legacy_counters(apps, schema_editor):
+    rebuild_task_counters(apps.get_model('todo', 'Task'), apps.get_model('todo', 'TaskCounter'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0023_taskcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, rebuild_legacy_counters),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_user_project_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='taskcounter',
+            name='task_counter_key_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='status_code',
+            field=models.SmallIntegerField(choices=STATUS_CHOICES, default=0),
+        ),
+        migrations.RunPython(convert_statuses, restore_statuses),
+        migrations.RemoveField(
+            model_name='task',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='task',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.RemoveField(
+            model_name='taskcounter',
+            name='status',
+        ),
+        migrations.RunPython(clear_counters, clear_counters),
+        migrations.AddField(
+            model_name='taskcounter',
+            name='status',
+            field=models.SmallIntegerField(choices=STATUS_CHOICES, default=0),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'project', 'status'], name='task_user_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskcounter',
+            index=models.Index(fields=['project', 'tab', 'status'], name='task_counter_key_idx'),
+        ),
+        migrations.RunPython(rebuild_aggregates, migrations.RunPython.noop),
+    ]
@@ -1,22 +1,63 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Project(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     tree_data = models.JSONField(null=True, blank=True)
+    tree_version = models.PositiveIntegerField(default=0)  # tree_dataのバージョン（更新のたびに+1）
+    updated_at = models.DateTimeField(auto_now=True)  # 最終更新日時（差分エクスポート用）
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='project_user_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+# tree_dataへの差分（JSON Patch）の履歴
+class TreeChange(models.Model):
+    project = models.ForeignKey(Project, related_name='tree_changes', on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()  # この差分を適用した後のバージョン
+    operations = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'version'], name='unique_tree_change_version'),
+        ]
+
+    def __str__(self):
+        return f'{self.project_id}@{self.version}'
     
 class Tab(models.Model):
     project = models.ForeignKey(Project, related_name='tabs', on_delete=models.CASCADE)  # プロジェクトに関連付けられたタグ
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)  # 最終更新日時（差分エクスポート用）
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'updated_at'], name='tab_project_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+# タスクのステータス（DBには整数で保存し、APIやエクスポートでは従来の表示名で入出力する）
+class TaskStatus(models.IntegerChoices):
+    NOT_STARTED = 0, '未着手'
+    IN_PROGRESS = 1, '進行中'
+    DONE = 2, '完了'
+
+
+# 表示名 -> ステータス / ステータス -> 表示名
+STATUS_BY_LABEL = {label: value for value, label in TaskStatus.choices}
+STATUS_LABELS = dict(TaskStatus.choices)
+
+
 class Task(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -27,7 +68,7 @@ class Task(models.Model):
 
     # タスクフィールド
     title = models.CharField(max_length=200)
-    status = models.CharField(max_length=10, default='未着手')
+    status = models.SmallIntegerField(choices=TaskStatus.choices, default=TaskStatus.NOT_STARTED)
     
     background = models.TextField(null=True, blank=True)  # 背景
     purpose = models.TextField(null=True, blank=True)  # 目的
@@ -48,7 +89,143 @@ class Task(models.Model):
     achievement = models.FloatField(null=True, blank=True)  # 達成度（%）
     comment = models.TextField(null=True, blank=True)  # コメント
 
+    updated_at = models.DateTimeField(auto_now=True)  # 最終更新日時（差分エクスポート用）
+
+    class Meta:
+        indexes = [
+            # 通知（ユーザー毎の開始予定日時の範囲検索）
+            models.Index(fields=['user', 'scheduled_start_time'], name='task_user_start_idx'),
+            # 通知スケジューラの全ユーザー分の読み直し
+            models.Index(fields=['scheduled_start_time'], name='task_start_idx'),
+            # ユーザー毎のプロジェクト・ステータスでの絞り込み（プロジェクトのタスクのプリフェッチも）
+            models.Index(fields=['user', 'project', 'status'], name='task_user_project_status_idx'),
+            # 更新日時での差分エクスポート
+            models.Index(fields=['user', 'updated_at'], name='task_user_updated_idx'),
+            # 通知スケジューラが他のプロセスでの変更を読み直す（全ユーザー分）
+            models.Index(fields=['updated_at'], name='task_updated_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-    
+
+# tree_dataのノード・エッジを正規化したもの（SQLで部分木や近傍を検索するため）
+# tree_dataの保存時にtodo.tree.sync_treeで同期する
+class TreeNode(models.Model):
+    project = models.ForeignKey(Project, related_name='tree_nodes', on_delete=models.CASCADE)
+    node_id = models.CharField(max_length=255)  # tree_data内のノードのid
+    task = models.ForeignKey(Task, related_name='tree_nodes', on_delete=models.SET_NULL, null=True, blank=True)  # ノードに紐付いたタスク
+    data = models.JSONField()  # ノードのJSONそのもの
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'node_id'], name='unique_tree_node_id'),
+        ]
+
+    def __str__(self):
+        return self.node_id
+
+
+class TreeEdge(models.Model):
+    project = models.ForeignKey(Project, related_name='tree_edges', on_delete=models.CASCADE)
+    edge_id = models.CharField(max_length=255)  # tree_data内のエッジのid（なければ"source->target"）
+    source = models.CharField(max_length=255)  # 親ノードのnode_id
+    target = models.CharField(max_length=255)  # 子ノードのnode_id
+    data = models.JSONField()  # エッジのJSONそのもの
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'source'], name='tree_edge_source_idx'),
+            models.Index(fields=['project', 'target'], name='tree_edge_target_idx'),
+        ]
+
+    def __str__(self):
+        return self.edge_id
+
+
+# 送信待ちのメール（todo.mailの送信処理がまとめて送る）
+class OutgoingEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField()  # 宛先のリスト
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)  # 送信完了日時
+    attempts = models.PositiveSmallIntegerField(default=0)  # 送信を試みた回数
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now)  # 次に送信する日時（送信済み・送信を諦めたらNone）
+    last_error = models.TextField(blank=True)
+    claim = models.CharField(max_length=32, blank=True)  # 送信処理が取得したときの識別子（二重送信防止）
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='outgoing_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.subject
+
+
+# タスクの集計（ユーザー・プロジェクト・日・難易度毎）
+# タスクの保存・削除時にtodo.analyticsで差分だけ更新する（値は全て合計なので足し引きできる）
+class TaskStat(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, related_name='task_stats', on_delete=models.CASCADE)
+    day = models.DateField(null=True, blank=True)  # 完了日時・開始予定日時・締め切りのうち最初にあるものの日付
+    difficulty = models.IntegerField(null=True, blank=True)
+
+    task_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    estimated_count = models.IntegerField(default=0)  # 想定作業時間と実際の作業時間が両方あるタスク数
+    expected_work_time = models.IntegerField(default=0)  # estimated_countのタスクの想定作業時間の合計（分）
+    actual_work_time = models.IntegerField(default=0)  # estimated_countのタスクの実際の作業時間の合計（分）
+    estimate_error = models.IntegerField(default=0)  # 実際 - 想定 の合計（分）
+    estimate_abs_error = models.IntegerField(default=0)  # |実際 - 想定| の合計（分）
+    overtime = models.IntegerField(default=0)  # 超過時間の合計（分）
+    achievement_total = models.FloatField(default=0)  # 達成度の合計
+    achievement_count = models.IntegerField(default=0)  # 達成度があるタスク数
+
+    class Meta:
+        indexes = [
+            # ダッシュボードの期間での集計
+            models.Index(fields=['user', 'day'], name='task_stat_user_day_idx'),
+            # タスクの保存時に更新する行の検索
+            models.Index(fields=['project', 'day', 'difficulty'], name='task_stat_key_idx'),
+        ]
+
+
+# タブ・プロジェクトのステータス毎のタスク数と作業時間の合計（カンバンのヘッダー用）
+# タスクの保存・削除時にtodo.analyticsで差分だけ更新する（タブのないタスクはtab=None）
+class TaskCounter(models.Model):
+    project = models.ForeignKey(Project, related_name='task_counters', on_delete=models.CASCADE)
+    tab = models.ForeignKey(Tab, related_name='task_counters', on_delete=models.CASCADE, null=True, blank=True)
+    status = models.SmallIntegerField(choices=TaskStatus.choices)
+
+    task_count = models.IntegerField(default=0)
+    expected_work_time = models.IntegerField(default=0)  # 想定作業時間の合計（分）
+    actual_work_time = models.IntegerField(default=0)  # 実際の作業時間の合計（分）
+
+    class Meta:
+        indexes = [
+            # タスクの保存時に更新する行の検索
+            models.Index(fields=['project', 'tab', 'status'], name='task_counter_key_idx'),
+        ]
+
+
+# 削除されたプロジェクト・タブ・タスクの記録（差分同期 /api/sync/ で削除を伝える）
+# post_deleteのシグナルで作成するので、プロジェクト・タブの削除でCASCADEされたものも記録される
+class Tombstone(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10)  # project / tab / task
+    object_id = models.IntegerField()  # 削除されたもののid
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # ユーザー毎の削除日時での差分同期
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+            # 保存期間を過ぎたものの削除
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}'
@@ -0,0 +1,180 @@
+import heapq
+import threading
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Task
+
+
+# 開始予定時刻の何分前に通知するか（旧TaskNotificationViewの「1分以内に開始」と同じ）
+NOTIFY_AHEAD = timezone.timedelta(minutes=1)
+# メモリに載せる先読み範囲と、DBから読み直す間隔
+HORIZON = timezone.timedelta(hours=1)
+RESYNC_INTERVAL = timezone.timedelta(minutes=10)
+# 別プロセス（gunicornの他のワーカー）での保存・削除はシグナルが届かないので、
+# この間隔で更新日時が新しいタスクと、次の確認までに通知するタスクの存在を読み直す
+POLL_INTERVAL = timezone.timedelta(seconds=15)
+# 更新日時の順にコミットされるとは限らないので、前回の確認より少し前から読み直す
+POLL_OVERLAP = timezone.timedelta(seconds=5)
+
+
+def task_event(task):
+    return {
+        'id': task.id,
+        'title': task.title,
+        'scheduled_start_time': task.scheduled_start_time,
+    }
+
+
+class TaskScheduler:
+    """
+    プロセス内で1つだけ動くタスク開始通知のスケジューラ
+    - 通知時刻順のヒープで直近のタスクを保持し、Taskの保存・削除シグナルで更新する
+    - 通知時刻になったら接続中のユーザーのキューへ配信する（クライアント毎のDBクエリはなし）
+    - 他のプロセスでの変更はPOLL_INTERVAL毎にpoll()で取り込む
+    """
+
+    def __init__(self):
+        self.active = False
+        self._condition = threading.Condition()
+        self._heap = []  # (通知時刻, task_id)
+        self._entries = {}  # task_id -> (通知時刻, user_id, event)
+        self._subscribers = {}  # user_id -> {(loop, queue)}
+        self._sent = {}  # task_id -> 配信済みの通知時刻（読み直しで同じ通知を二重に送らない）
+        self._next_resync = None
+        self._polled_at = None
+        self._next_poll = None
+
+    def start(self):
+        with self._condition:
+            if self.active:
+                return
+            self.active = True
+        threading.Thread(target=self._run, name='task-scheduler', daemon=True).start()
+
+    # 購読（イベントループ側から呼ぶ）
+    def subscribe(self, user_id, queue, loop):
+        with self._condition:
+            self._subscribers.setdefault(user_id, set()).add((loop, queue))
+
+    def unsubscribe(self, user_id, queue, loop):
+        with self._condition:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard((loop, queue))
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    # Taskの保存・削除シグナルから呼ぶ
+    def task_saved(self, task):
+        if not self.active:
+            return
+        with self._condition:
+            self._apply(task, timezone.now())
+            self._condition.notify()
+
+    def task_deleted(self, task_id):
+        if not self.active:
+            return
+        with self._condition:
+            # ヒープからは取り出した時に読み捨てる
+            self._entries.pop(task_id, None)
+
+    def _apply(self, task, now):
+        if task.scheduled_start_time is None or not now <= task.scheduled_start_time <= now + HORIZON:
+            self._entries.pop(task.id, None)
+        else:
+            self._push(task)
+
+    def _push(self, task):
+        notify_at = task.scheduled_start_time - NOTIFY_AHEAD
+        if self._sent.get(task.id) == notify_at:
+            return
+        self._entries[task.id] = (notify_at, task.user_id, task_event(task))
+        heapq.heappush(self._heap, (notify_at, task.id))
+
+    def resync(self, now=None):
+        now = now or timezone.now()
+        tasks = list(Task.objects.filter(
+            scheduled_start_time__gte=now,
+            scheduled_start_time__lte=now + HORIZON,
+        ).only('id', 'user_id', 'title', 'scheduled_start_time'))
+        with self._condition:
+            self._heap = []
+            self._entries = {}
+            # 開始時刻を過ぎたものは読み直されないので配信済みの記録も要らない
+            self._sent = {task_id: notify_at for task_id, notify_at in self._sent.items() if notify_at + NOTIFY_AHEAD >= now}
+            for task in tasks:
+                self._push(task)
+            self._next_resync = now + RESYNC_INTERVAL
+            self._polled_at = now
+            self._next_poll = now + POLL_INTERVAL
+            self._condition.notify()
+
+    def poll(self, now=None):
+        """
+        前回の確認以降に保存されたタスクと、次の確認までに通知するタスクが残っているかを読み直す（最大2クエリ）
+        """
+        now = now or timezone.now()
+        since = (self._polled_at or now) - POLL_OVERLAP
+        tasks = list(Task.objects.filter(updated_at__gt=since).only('id', 'user_id', 'title', 'scheduled_start_time'))
+        with self._condition:
+            due_ids = [task_id for task_id, (notify_at, _, _) in self._entries.items() if notify_at <= now + POLL_INTERVAL]
+        existing = set(Task.objects.filter(id__in=due_ids).values_list('id', flat=True)) if due_ids else set()
+        with self._condition:
+            for task in tasks:
+                self._apply(task, now)
+            for task_id in due_ids:
+                if task_id not in existing:
+                    self._entries.pop(task_id, None)
+            self._polled_at = now
+            self._next_poll = now + POLL_INTERVAL
+            self._condition.notify()
+
+    # 通知時刻を過ぎたイベントを取り出して配信する
+    def dispatch_due(self, now=None):
+        now = now or timezone.now()
+        deliveries = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                notify_at, task_id = heapq.heappop(self._heap)
+                entry = self._entries.get(task_id)
+                if entry is None or entry[0] != notify_at:
+                    continue  # 削除・時刻変更済み
+                del self._entries[task_id]
+                self._sent[task_id] = notify_at
+                _, user_id, event = entry
+                for loop, queue in self._subscribers.get(user_id, ()):
+                    deliveries.append((loop, queue, event))
+        for loop, queue, event in deliveries:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        return len(deliveries)
+
+    def _seconds_until_next(self, now):
+        deadline = min(self._next_resync, self._next_poll)
+        if self._heap and self._heap[0][0] < deadline:
+            deadline = self._heap[0][0]
+        return max((deadline - now).total_seconds(), 0)
+
+    def _run(self):
+        while True:
+            try:
+                now = timezone.now()
+                if self._next_resync is None or now >= self._next_resync:
+                    self.resync(now)
+                    close_old_connections()
+                elif now >= self._next_poll:
+                    self.poll(now)
+                    close_old_connections()
+                self.dispatch_due(now)
+                with self._condition:
+                    self._condition.wait(self._seconds_until_next(timezone.now()))
+            except Exception:
+                # DBエラーなどでスレッドが止まらないように、少し待って再試行
+                with self._condition:
+                    self._condition.wait(5)
+
+
+scheduler = TaskScheduler()
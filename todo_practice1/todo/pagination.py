@@ -0,0 +1,14 @@
+from asgiref.sync import sync_to_async
+from rest_framework.pagination import CursorPagination
+
+
+# 主キー（インデックス済み）で並べるカーソルページネーション
+# OFFSETを使わないので件数が増えてもページ取得のコストが一定
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    # 非同期ビュー用（CursorPagination.paginate_querysetをそのままスレッドで実行する）
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
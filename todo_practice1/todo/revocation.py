@@ -0,0 +1,131 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+# DBの失効リスト（token_blacklist）をメモリに読み込む間隔（他のプロセスで失効したものを反映）
+SYNC_INTERVAL = 60
+# 有効期限切れのOutstandingToken / BlacklistedTokenを削除する間隔
+PRUNE_INTERVAL = 60 * 60
+
+
+def revoked_key(jti):
+    return f'todo:revoked-jti:{jti}'
+
+
+class RevocationStore:
+    """
+    失効したリフレッシュトークンのjtiを有効期限まで保持する
+    - 失効の確認はメモリの集合（と共有キャッシュ）だけで行い、失効していないトークンではDBにアクセスしない
+    - DBのBlacklistedTokenはSYNC_INTERVAL毎に差分だけ読み込み、期限切れのものは捨てる
+    """
+
+    def __init__(self, sync_interval=SYNC_INTERVAL, prune_interval=PRUNE_INTERVAL):
+        self.sync_interval = sync_interval
+        self.prune_interval = prune_interval
+        self._revoked = {}  # jti -> 有効期限（エポック秒）
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_id = 0
+        self._next_sync = 0
+        self._next_prune = 0
+
+    def is_revoked(self, jti):
+        self.sync_if_due()
+        with self._lock:
+            if jti in self._revoked:
+                return True
+        if settings.TOKEN_REVOCATION_SHARED_CACHE:
+            return cache.get(revoked_key(jti)) is not None
+        return False
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._revoked[jti] = exp
+        if settings.TOKEN_REVOCATION_SHARED_CACHE:
+            cache.set(revoked_key(jti), True, max(int(exp - time.time()), 1))
+
+    def sync_if_due(self):
+        if time.monotonic() < self._next_sync:
+            return
+        # 読み込み中の他のスレッドは読み込みが終わるまで待つ（途中の集合で判定しない）
+        with self._sync_lock:
+            if time.monotonic() < self._next_sync:
+                return
+            self.sync()
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def sync(self):
+        now = timezone.now()
+        rows = (BlacklistedToken.objects.filter(id__gt=self._last_id)
+                .order_by('id').values_list('id', 'token__jti', 'token__expires_at'))
+        revoked = {}
+        for row_id, jti, expires_at in rows:
+            self._last_id = row_id
+            if expires_at > now:
+                revoked[jti] = expires_at.timestamp()
+
+        with self._lock:
+            self._revoked.update(revoked)
+            for jti in [jti for jti, exp in self._revoked.items() if exp <= now.timestamp()]:
+                del self._revoked[jti]
+
+        if time.monotonic() >= self._next_prune:
+            OutstandingToken.objects.filter(expires_at__lte=now).delete()
+            self._next_prune = time.monotonic() + self.prune_interval
+
+    def clear(self):
+        with self._sync_lock, self._lock:
+            self._revoked.clear()
+            self._last_id = 0
+            self._next_sync = 0
+
+
+revocation_store = RevocationStore()
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    失効の確認をRevocationStoreで行うリフレッシュトークン（失効の登録はDBとRevocationStoreの両方）
+    """
+
+    def check_blacklist(self):
+        if revocation_store.is_revoked(self.payload[jwt_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        blacklisted, created = super().blacklist()
+        revocation_store.add(self.payload[jwt_settings.JTI_CLAIM], self.payload['exp'])
+        return blacklisted, created
+
+
+class RevocationTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                # 同じトークンで同時に更新された場合は先に失効させた方だけを通す
+                _, created = refresh.blacklist()
+                if not created:
+                    raise TokenError('Token is blacklisted')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class RevocationTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = RevocableRefreshToken
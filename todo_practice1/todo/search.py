@@ -0,0 +1,233 @@
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Task
+
+
+# タスクの全文検索の索引（0020_task_search で作成）
+# - SQLite: FTS5の仮想テーブル（rowid = タスクのid）
+# - PostgreSQL: tsvectorの列とGINインデックスを持つテーブル
+# - それ以外: 索引は作らず、LIKEで検索する（関連度の順ではなくidの順）
+# 日本語は単語に区切れないので、文字のバイグラムを語として索引する
+SEARCH_TABLE = 'todo_task_search'
+TEXT_FIELDS = ('title', 'background', 'purpose', 'description', 'comment')
+# タイトルの一致を本文の一致より上位にする（SQLiteのbm25の重み）
+TITLE_WEIGHT = 4.0
+
+
+def runs(text):
+    # 記号・空白で区切った文字列（全角英数字は半角に、英字は小文字にそろえる）
+    return re.findall(r'[^\W_]+', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def run_tokens(run):
+    """
+    文字列のバイグラムと最後の1文字（1文字での前方一致検索用）
+    例: 'タスク' -> ['タス', 'スク', 'ク']
+    """
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def document_tokens(text):
+    return [token for run in runs(text) for token in run_tokens(run)]
+
+
+def search_terms(query):
+    """
+    検索語を区切った文字列毎の語のリスト（全て含むタスクを返す）
+    2文字以上はバイグラムの連続（フレーズ）、1文字はその文字で始まる語の前方一致
+    """
+    return [[run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)] for run in runs(query)]
+
+
+class SqliteSearchBackend:
+    create_sql = [
+        f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(title, body, user_id UNINDEXED)',
+    ]
+    drop_sql = [f'DROP TABLE IF EXISTS {SEARCH_TABLE}']
+
+    def write(self, cursor, rows, deleted_ids):
+        ids = [(row[0],) for row in rows] + [(task_id,) for task_id in deleted_ids]
+        if ids:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', ids)
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, user_id, title, body) VALUES (%s, %s, %s, %s)',
+                [(task_id, user_id, ' '.join(title), ' '.join(body)) for task_id, user_id, title, body in rows],
+            )
+
+    def search(self, cursor, user_id, terms, limit, offset):
+        match = ' AND '.join(f'"{term[0]}"*' if len(term[0]) == 1 else '"' + ' '.join(term) + '"' for term in terms)
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND user_id = %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, 1.0), rowid LIMIT %s OFFSET %s',
+            [match, user_id, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    create_sql = [
+        f'CREATE TABLE {SEARCH_TABLE} (task_id bigint PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL)',
+        f'CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)',
+        f'CREATE INDEX {SEARCH_TABLE}_user_idx ON {SEARCH_TABLE} (user_id)',
+    ]
+    drop_sql = [f'DROP TABLE IF EXISTS {SEARCH_TABLE}']
+
+    def vector(self, title, body):
+        # パーサーを通さないようにtsvectorのリテラルを直接作る（タイトルは重みA）
+        # tsvectorの位置は16383までなので、それ以降の語は位置なしで入れる
+        lexemes = [f"'{token}':{min(i, 16383)}A" for i, token in enumerate(title, 1)]
+        lexemes += [f"'{token}':{min(i, 16383)}" for i, token in enumerate(body, len(title) + 2)]
+        return ' '.join(lexemes)
+
+    def write(self, cursor, rows, deleted_ids):
+        if deleted_ids:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE task_id = ANY(%s)', [list(deleted_ids)])
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (task_id, user_id, document) VALUES (%s, %s, %s::tsvector) '
+                f'ON CONFLICT (task_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document',
+                [(task_id, user_id, self.vector(title, body)) for task_id, user_id, title, body in rows],
+            )
+
+    def search(self, cursor, user_id, terms, limit, offset):
+        query = ' & '.join(
+            f"'{term[0]}':*" if len(term[0]) == 1 else '(' + ' <-> '.join(f"'{token}'" for token in term) + ')'
+            for term in terms
+        )
+        cursor.execute(
+            f'SELECT task_id FROM {SEARCH_TABLE}, CAST(%s AS tsquery) query '
+            f'WHERE user_id = %s AND document @@ query ORDER BY ts_rank(document, query) DESC, task_id LIMIT %s OFFSET %s',
+            [query, user_id, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class LikeSearchBackend:
+    create_sql = []
+    drop_sql = []
+
+    def write(self, cursor, rows, deleted_ids):
+        pass
+
+    def search(self, cursor, user_id, terms, limit, offset):
+        tasks = Task.objects.filter(user_id=user_id)
+        for term in terms:
+            # バイグラムを元の文字列に戻す
+            run = term[0] + ''.join(token[1] for token in term[1:])
+            condition = Q()
+            for name in TEXT_FIELDS:
+                condition |= Q(**{f'{name}__icontains': run})
+            tasks = tasks.filter(condition)
+        return list(tasks.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+
+def get_backend(vendor=None):
+    vendor = vendor or connection.vendor
+    if vendor == 'sqlite':
+        return SqliteSearchBackend()
+    if vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return LikeSearchBackend()
+
+
+def index_row(values):
+    body = '\n'.join(filter(None, (values[name] for name in TEXT_FIELDS[1:])))
+    return values['id'], values['user_id'], document_tokens(values['title']), document_tokens(body)
+
+
+def write_index(tasks, deleted_ids=()):
+    """
+    tasks（TaskまたはTEXT_FIELDSを含むdict）の索引を作り直し、deleted_idsの索引を削除する
+    """
+    rows = []
+    for task in tasks:
+        if isinstance(task, Task):
+            if task.get_deferred_fields() & set(TEXT_FIELDS):
+                task = Task.objects.filter(id=task.id).values('id', 'user_id', *TEXT_FIELDS).first()
+                if task is None:
+                    continue
+            else:
+                task = {'id': task.id, 'user_id': task.user_id, **{name: getattr(task, name) for name in TEXT_FIELDS}}
+        rows.append(index_row(task))
+    if not rows and not deleted_ids:
+        return
+    with connection.cursor() as cursor:
+        get_backend().write(cursor, rows, deleted_ids)
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch_index():
+    """
+    ブロック内の索引の更新をまとめて最後に行う（一括操作用）
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = {}
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+    write_index([task for task in pending.values() if task is not None],
+                [task_id for task_id, task in pending.items() if task is None])
+
+
+def task_saved(task, update_fields=None):
+    if update_fields is not None and not set(update_fields) & {'user', 'user_id', *TEXT_FIELDS}:
+        return
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        write_index([task])
+    else:
+        pending[task.id] = task
+
+
+def task_deleted(task_id):
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        write_index([], [task_id])
+    else:
+        pending[task_id] = None
+
+
+def search_task_ids(user_id, query, limit, offset=0):
+    """
+    ユーザーのタスクをqueryで検索し、関連度の高い順にidを返す
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    with connection.cursor() as cursor:
+        return get_backend().search(cursor, user_id, terms, limit, offset)
+
+
+def rebuild_search_index(task_model=Task, schema_editor=None):
+    """
+    索引のテーブルを作り直し、全タスクを索引する（マイグレーション・manage.py rebuild_search_index用）
+    """
+    db = schema_editor.connection if schema_editor else connection
+    backend = get_backend(db.vendor)
+    with db.cursor() as cursor:
+        for sql in backend.drop_sql + backend.create_sql:
+            cursor.execute(sql)
+        tasks = task_model.objects.using(db.alias).values('id', 'user_id', *TEXT_FIELDS).order_by('id')
+        rows = []
+        for task in tasks.iterator(chunk_size=500):
+            rows.append(index_row(task))
+            if len(rows) >= 500:
+                backend.write(cursor, rows, ())
+                rows = []
+        backend.write(cursor, rows, ())
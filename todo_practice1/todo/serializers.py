@@ -1,27 +1,166 @@
+from functools import partial
 from rest_framework import serializers
-from .models import Task, Tab, Project
+from rest_framework.settings import ISO_8601, api_settings
+from .models import STATUS_BY_LABEL, STATUS_LABELS, Task, Tab, Project
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .metrics import measure_serialization
+from .analytics import counter_summary
+
+
+class DynamicFieldsMixin:
+    """
+    fields / expand 引数でレスポンスに含めるフィールドを絞り込む
+    - fields: 返すフィールド名の集合（Noneなら全て）
+    - nested_fields: ネストしたシリアライザ毎に返すフィールド名 {'tasks': {'id', 'title'}}
+    - expand: expandable_fields のうち展開するもの（Noneなら全て展開）
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        nested_fields = kwargs.pop('nested_fields', None) or {}
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        if expand is not None:
+            for name in self.expandable_fields:
+                if name not in expand:
+                    self.fields.pop(name, None)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand or ()):
+                self.fields.pop(name)
+        for name, child_fields in nested_fields.items():
+            if name in self.fields:
+                child = self.fields[name].child
+                for child_name in set(child.fields) - set(child_fields):
+                    child.fields.pop(child_name)
+
+    # シリアライズの時間を計測する（todo.metrics、Server-Timingのserialize）
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+def datetime_converter(field):
+    # DateTimeField.to_representationと同じ変換（ISO 8601、フィールドのタイムゾーンに変換してUTCは末尾をZにする）
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None or getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def field_converter(field):
+    """
+    フィールドのto_representationと同じ結果を返す関数（値がNoneの場合は呼ばない）
+    Noneはそのままの値を返すもの
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if type(field) is serializers.CharField:
+        return str
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.FloatField:
+        return float
+    if type(field) is serializers.DateTimeField:
+        return datetime_converter(field)
+    return field.to_representation
+
+
+class RowSerializerMixin:
+    """
+    フィールド毎の変換関数を前もって用意し、モデルのインスタンスまたは.values()のdict（行）から直接出力を作る
+    ModelSerializerのフィールド毎のget_attribute / to_representationの呼び出しを省く（出力は同じ）
+    """
+
+    def row_fields(self):
+        """
+        (出力名, モデルの属性名, 変換関数) のリスト
+        """
+        if not hasattr(self, '_row_fields'):
+            model = self.Meta.model
+            self._row_fields = [
+                (name, model._meta.get_field(field.source).attname, field_converter(field))
+                for name, field in self.fields.items() if not field.write_only
+            ]
+        return self._row_fields
+
+    def row_columns(self):
+        # .values()で読み込む列（カーソルページネーション用にidは必ず含める）
+        return list(dict.fromkeys(['id', *(column for _, column, _ in self.row_fields())]))
+
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            # validated_dataなど.values()の行でないdictは通常の処理
+            if not all(column in instance for _, column, _ in self.row_fields()):
+                return super().to_representation(instance)
+            get = instance.__getitem__
+        else:
+            get = partial(getattr, instance)
+        with measure_serialization():
+            ret = {}
+            for name, column, convert in self.row_fields():
+                value = get(column)
+                ret[name] = value if value is None or convert is None else convert(value)
+            return ret
+
+
+class StatusField(serializers.ChoiceField):
+    """
+    整数で保存したステータスを従来の表示名（'未着手'など）で入出力する
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(choices=list(STATUS_BY_LABEL), **kwargs)
+
+    def to_internal_value(self, data):
+        return STATUS_BY_LABEL[super().to_internal_value(data)]
+
+    def to_representation(self, value):
+        return STATUS_LABELS[value]
+
+
+class TaskSerializer(RowSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    status = StatusField(required=False)
 
-class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ('id', 'tab', 'project', 'title', 'status', 'purpose', 'background', 'description', 'scheduled_start_time', 'due_date', 
                   'actual_start_time', 'completion_date', 'difficulty', 'expected_work_time', 'actual_work_time', 'overtime', 'achievement', 'comment')
 
-class TabSerializer(serializers.ModelSerializer):
+class TabSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     tasks = TaskSerializer(many=True, read_only=True)
+    # タスク数・作業時間の合計（TaskCounterから計算するのでタスクを読まない）
+    summary = serializers.SerializerMethodField()
+    expandable_fields = ('tasks', 'summary')
 
     class Meta:
         model = Tab
-        fields = ('id', 'name', 'tasks', 'project')
+        fields = ('id', 'name', 'tasks', 'project', 'summary')
+
+    def get_summary(self, tab):
+        return counter_summary(tab.task_counters.all())
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     tasks = TaskSerializer(many=True, read_only=True)
+    summary = serializers.SerializerMethodField()
+    expandable_fields = ('tasks', 'summary')
 
     class Meta:
         model = Project
-        fields = ('id', 'name', 'tree_data', 'tasks')
+        fields = ('id', 'name', 'tree_data', 'tree_version', 'tasks', 'summary')
+        read_only_fields = ('tree_version',)
+
+    def get_summary(self, project):
+        return counter_summary(project.task_counters.all())
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import analytics, search, sync
+from .authentication import invalidate_user
+from .caching import bump_project_version, bump_user_version
+from .metrics import record_query
+from .models import Project, Tab, Task
+from .notifications import scheduler
+
+
+# タスク開始通知のスケジュールを最新に保つ
+@receiver(post_save, sender=Task)
+def schedule_task_notification(sender, instance, **kwargs):
+    scheduler.task_saved(instance)
+
+
+@receiver(post_delete, sender=Task)
+def cancel_task_notification(sender, instance, **kwargs):
+    scheduler.task_deleted(instance.id)
+
+
+# タスクの集計（TaskStat）とタブ・プロジェクトのカウンター（TaskCounter）を差分で更新する
+# 読み込んだ時点の値を覚えておき、保存・削除時に変わった分だけ足し引きする
+@receiver(post_init, sender=Task)
+def remember_task_stat_values(sender, instance, **kwargs):
+    analytics.remember_task(instance)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def load_task_stat_values(sender, instance, **kwargs):
+    analytics.load_task_values(instance)
+
+
+@receiver(post_save, sender=Task)
+def update_task_stats(sender, instance, created, **kwargs):
+    analytics.task_saved(instance, created)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_stats(sender, instance, **kwargs):
+    analytics.task_deleted(instance)
+
+
+# 全文検索の索引を更新する
+@receiver(post_save, sender=Task)
+def index_task(sender, instance, update_fields=None, **kwargs):
+    search.task_saved(instance, update_fields)
+
+
+@receiver(post_delete, sender=Task)
+def unindex_task(sender, instance, **kwargs):
+    search.task_deleted(instance.id)
+
+
+# 一覧のキャッシュを無効にするため、ユーザーのデータのバージョンを上げる
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_version_for_user_data(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=Tab)
+@receiver(post_delete, sender=Tab)
+def bump_version_for_tab(sender, instance, **kwargs):
+    if settings.RESPONSE_CACHE_ENABLED:
+        bump_user_version(Project.objects.filter(id=instance.project_id).values_list('user_id', flat=True).first())
+
+
+# ボード（/api/projects/<id>/board/）のキャッシュを無効にするため、プロジェクトのバージョンを上げる
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def bump_version_for_project(sender, instance, **kwargs):
+    bump_project_version(instance.id)
+
+
+@receiver(post_save, sender=Tab)
+@receiver(post_delete, sender=Tab)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_version_for_project_data(sender, instance, **kwargs):
+    bump_project_version(instance.project_id)
+
+
+@receiver(pre_save, sender=Task)
+def bump_version_for_moved_task(sender, instance, **kwargs):
+    # 別のプロジェクトに移したタスクは移動元のボードからも消える（_stat_valuesは保存前の値）
+    old = getattr(instance, '_stat_values', None)
+    if old is not None and old['project_id'] != instance.project_id:
+        bump_project_version(old['project_id'])
+
+
+# 差分同期（/api/sync/）のために削除を記録する（プロジェクト・タブの削除でCASCADEされたものも）
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+def record_deletion(sender, instance, origin=None, **kwargs):
+    if not sync.is_user_deletion(origin):
+        sync.record_deletion(sender._meta.model_name, instance.id, instance.user_id)
+
+
+@receiver(post_delete, sender=Tab)
+def record_tab_deletion(sender, instance, origin=None, **kwargs):
+    if sync.is_user_deletion(origin):
+        return
+    if isinstance(origin, Project):
+        user_id = origin.user_id
+    else:
+        user_id = Project.objects.filter(id=instance.project_id).values_list('user_id', flat=True).first()
+    sync.record_deletion('tab', instance.id, user_id)
+
+
+# 認証用にキャッシュしているユーザーを破棄する（パスワードやis_activeの変更を反映）
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+# bulk_create / bulk_update はシグナルを送らないので、保存後にまとめて送る
+def send_bulk_post_save(sender, instances, created, update_fields=None):
+    for instance in instances:
+        post_save.send(
+            sender=sender, instance=instance, created=created,
+            update_fields=frozenset(update_fields) if update_fields else None,
+            raw=False, using=instance._state.db,
+        )
+
+
+# SQLiteの接続ごとの設定（WALなど）
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+# リクエストの計測用に、接続毎にSQLの実行を計測するラッパーを設定する
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if settings.REQUEST_METRICS_ENABLED and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
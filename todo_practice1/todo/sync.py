@@ -0,0 +1,169 @@
+import datetime
+import heapq
+import itertools
+import re
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from .export import EXPORT_FIELDS, export_values
+from .models import Project, Tab, Task, Tombstone
+
+
+# 1回の応答に含める件数の既定値と上限
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+# この秒数以内の変更は次の同期でも返す（更新日時の順にコミットされるとは限らないため、遅れてコミットされたものを取りこぼさない）
+SETTLE_SECONDS = 5
+# 削除の記録を残す期間（これより古いカーソルは全件の同期からやり直す。初回の同期の途中のカーソルは除く）
+TOMBSTONE_RETENTION = datetime.timedelta(days=90)
+
+# 同じ日時の変更は親から順に返す（削除の記録は最後）
+KINDS = ('project', 'tab', 'task', 'deleted')
+# 先頭のiは初回の同期（sinceなし）の続きのページのカーソル
+CURSOR_PATTERN = re.compile(r'^(i?)(\d+)-(\d)-(\d+)$')
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class CursorError(ValueError):
+    pass
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def encode_cursor(key, initial=False):
+    moment, rank, pk = key
+    return f'{"i" if initial else ""}{(moment - EPOCH) // datetime.timedelta(microseconds=1)}-{rank}-{pk}'
+
+
+def decode_cursor(value):
+    """
+    カーソル（"[i]<マイクロ秒>-<種類>-<id>"）を ((日時, 種類の順番, id), 初回の同期の途中か) にする
+    """
+    match = CURSOR_PATTERN.match(value)
+    if match is None or int(match[3]) >= len(KINDS):
+        raise CursorError(value)
+    try:
+        moment = EPOCH + datetime.timedelta(microseconds=int(match[2]))
+    except OverflowError:
+        raise CursorError(value)
+    return (moment, int(match[3]), int(match[4])), bool(match[1])
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch_tombstones():
+    """
+    ブロック内の削除の記録をまとめて最後に作成する（CASCADEで多数削除される場合など）
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = []
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+    Tombstone.objects.bulk_create(pending)
+
+
+def is_user_deletion(origin):
+    # ユーザーごと削除した場合は記録しない（同期するクライアントがいない）
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+def record_deletion(kind, object_id, user_id):
+    if user_id is None:
+        return
+    tombstone = Tombstone(user_id=user_id, kind=kind, object_id=object_id, deleted_at=timezone.now())
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        tombstone.save()
+    else:
+        pending.append(tombstone)
+
+
+def prune_tombstones(now=None):
+    return Tombstone.objects.filter(deleted_at__lt=(now or timezone.now()) - TOMBSTONE_RETENTION).delete()[0]
+
+
+def after(field, rank, cursor):
+    """
+    カーソルより後のものの条件（日時, 種類の順番, id の順）
+    """
+    if cursor is None:
+        return Q()
+    moment, cursor_rank, pk = cursor
+    if rank < cursor_rank:
+        return Q(**{f'{field}__gt': moment})
+    if rank > cursor_rank:
+        return Q(**{f'{field}__gte': moment})
+    return Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk})
+
+
+def row_changes(kind, rank, rows):
+    # EXPORT_FIELDSは先頭がid、最後がupdated_at
+    for row in rows:
+        yield (row[-1], rank, row[0]), {'type': kind, 'id': row[0], 'deleted': False, 'data': export_values(kind, row)}
+
+
+def tombstone_changes(rank, rows):
+    for pk, kind, object_id, deleted_at in rows:
+        yield (deleted_at, rank, pk), {'type': kind, 'id': object_id, 'deleted': True, 'deleted_at': deleted_at}
+
+
+def change_sources(user, cursor, limit):
+    """
+    種類毎に、カーソルより後の変更を日時の順に最大limit件ずつ返すイテレーターのリスト
+    要素は ((日時, 種類の順番, id), 変更)
+    """
+    querysets = {
+        'project': Project.objects.filter(user=user),
+        'tab': Tab.objects.filter(project__user=user),
+        'task': Task.objects.filter(user=user),
+    }
+    sources = []
+    for rank, (kind, queryset) in enumerate(querysets.items()):
+        columns = [f'{name}_id' if name in ('project', 'tab') else name for name in EXPORT_FIELDS[kind]]
+        rows = queryset.filter(after('updated_at', rank, cursor)).order_by('updated_at', 'id').values_list(*columns)[:limit]
+        sources.append(row_changes(kind, rank, rows))
+    # 初回の同期（カーソルなし）では削除を伝える必要がない
+    if cursor is not None:
+        rank = KINDS.index('deleted')
+        tombstones = (Tombstone.objects.filter(user=user).filter(after('deleted_at', rank, cursor))
+                      .order_by('deleted_at', 'id').values_list('id', 'kind', 'object_id', 'deleted_at')[:limit])
+        sources.append(tombstone_changes(rank, tombstones))
+    return sources
+
+
+def changes_since(user, cursor=None, limit=PAGE_SIZE, now=None, initial=False):
+    """
+    カーソルより後に作成・変更・削除されたプロジェクト・タブ・タスクを日時の順にlimit件まで返す
+    戻り値: (変更のリスト, 次のカーソル, まだ続きがあるか)
+    - 変更は {"type", "id", "deleted": false, "data": {...}}（データはエクスポートと同じ形式）
+      または {"type", "id", "deleted": true, "deleted_at"}
+    - 最後のページの次のカーソルはSETTLE_SECONDS前にする（直近の変更は次の同期でも返すので、クライアントは冪等に適用する）
+    - initial: カーソルが初回の同期の続きのページのものか
+      続きのページのカーソルは返した行の日時なので古いことがあるが、同期を始めた後の削除の記録は消えていないので期限切れにしない
+    """
+    now = now or timezone.now()
+    initial = cursor is None or initial
+    if not initial and cursor[0] < now - TOMBSTONE_RETENTION:
+        raise CursorExpired()
+    # 種類毎にlimit+1件まで読み、日時の順にマージする
+    merged = list(itertools.islice(heapq.merge(*change_sources(user, cursor, limit + 1), key=lambda item: item[0]), limit + 1))
+    has_more = len(merged) > limit
+    page = merged[:limit]
+    if has_more:
+        return [change for _, change in page], encode_cursor(page[-1][0], initial), has_more
+    # 最後のページ: 古い行で終わっても、カーソルをSETTLE_SECONDS前まで進める（それより前の変更は全て返している）
+    settled = (now - datetime.timedelta(seconds=SETTLE_SECONDS), 0, 0)
+    return [change for _, change in page], encode_cursor(settled), has_more
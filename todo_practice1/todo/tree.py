@@ -0,0 +1,205 @@
+from django.db import connection
+
+from .jsonpatch import JsonPatchError, apply_patch, parse_pointer
+from .models import Task, TreeEdge, TreeNode
+
+
+# ツリーの探索で辿る最大の深さ
+MAX_TREE_DEPTH = 100
+# 再帰CTEが作る行の上限
+# UNIONで重複を除くのは (ノード, 深さ) の組なので、両方向に辿ると同じノードが深さを変えて何度も現れる（密なグラフでは深さ分だけ増える）
+MAX_TREE_ROWS = 10000
+
+
+# ノードに紐付けられたタスクのid（taskNodeはノードのidがタスクのid）
+def node_task_id(node):
+    if node.get('type') != 'taskNode':
+        return None
+    try:
+        return int(node['id'])
+    except (TypeError, ValueError):
+        return None
+
+
+def edge_key(edge):
+    if edge.get('id') is not None:
+        return str(edge['id'])
+    return f"{edge.get('source')}->{edge.get('target')}"
+
+
+def tree_rows(tree_data):
+    """
+    tree_data（nodes と edges を含むJSON）をノード・エッジの行に分解する
+    戻り値: ({node_id: (task_id, node)}, {edge_id: (source, target, edge)})
+    """
+    if not isinstance(tree_data, dict):
+        return {}, {}
+    nodes, edges = {}, {}
+    for node in tree_data.get('nodes') or []:
+        if isinstance(node, dict) and node.get('id') is not None:
+            nodes[str(node['id'])] = (node_task_id(node), node)
+    for edge in tree_data.get('edges') or []:
+        if isinstance(edge, dict) and edge.get('source') is not None and edge.get('target') is not None:
+            edges[edge_key(edge)] = (str(edge['source']), str(edge['target']), edge)
+    return nodes, edges
+
+
+def element_id(tree_data, collection, token):
+    """
+    tree_data[collection]の添字tokenの要素のノード・エッジのid（なければNone、'-'は末尾の要素）
+    """
+    items = tree_data.get(collection) if isinstance(tree_data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None
+    if token == '-':
+        index = len(items) - 1
+    elif token.isdigit() and int(token) < len(items):
+        index = int(token)
+    else:
+        return None
+    item = items[index]
+    if not isinstance(item, dict):
+        return None
+    if collection == 'nodes':
+        return str(item['id']) if item.get('id') is not None else None
+    return edge_key(item)
+
+
+def patched_elements(operation):
+    """
+    操作が書き換えるノード・エッジの (nodes|edges, 添字, 操作の前に見るか, 後に見るか) のリスト
+    要素ごと追加する操作は後、削除する操作は前だけを見る（添字がずれた隣の要素は変わらない）
+    nodes / edges の配列ごと書き換える操作はNone
+    """
+    if not isinstance(operation, dict) or operation.get('op') == 'test':
+        return []
+    op = operation.get('op')
+    elements = []
+    for key in ('path', 'from'):
+        if key not in operation or (key == 'from' and op not in ('move', 'copy')):
+            continue
+        try:
+            tokens = parse_pointer(operation[key])
+        except JsonPatchError:
+            return []  # apply_patchでエラーになる
+        if not tokens:
+            return None
+        if tokens[0] not in ('nodes', 'edges'):
+            continue
+        if len(tokens) == 1:
+            return None
+        if len(tokens) > 2 or op == 'replace':
+            before, after = True, True
+        elif key == 'from':
+            before, after = op == 'move', False
+        else:
+            before, after = op == 'remove', op in ('add', 'move', 'copy')
+        elements.append((tokens[0], tokens[1], before, after))
+    return elements
+
+
+def apply_tree_patch(tree_data, operations):
+    """
+    tree_dataにJSON Patchを1操作ずつ適用し、(結果, 変更されたノードのid, 変更されたエッジのid) を返す
+    各操作の前後で、操作の添字にある要素のidを集める
+    要素を特定できない操作があればidはNone（sync_treeで全体を同期する）
+    """
+    if not isinstance(operations, list):
+        return apply_patch(tree_data, operations), None, None
+    touched = {'nodes': set(), 'edges': set()}
+    whole = False
+    for operation in operations:
+        elements = patched_elements(operation)
+        whole = whole or elements is None
+        for collection, token, before, _ in elements or ():
+            if before:
+                touched[collection].add(element_id(tree_data, collection, token))
+        tree_data = apply_patch(tree_data, [operation])
+        for collection, token, _, after in elements or ():
+            if after:
+                touched[collection].add(element_id(tree_data, collection, token))
+    if whole:
+        return tree_data, None, None
+    return tree_data, touched['nodes'] - {None}, touched['edges'] - {None}
+
+
+def sync_tree(project_id, user_id, tree_data, node_ids=None, edge_ids=None):
+    """
+    TreeNode / TreeEdge を tree_data と同じ内容にする
+    既存の行と比較して、追加・変更・削除のあった行だけを書き込む
+    node_ids / edge_ids を指定した場合はそのidの行だけを読み込んで同期する（JSON Patchでの差分更新用）
+    """
+    nodes, edges = tree_rows(tree_data)
+    existing_nodes = TreeNode.objects.filter(project_id=project_id)
+    existing_edges = TreeEdge.objects.filter(project_id=project_id)
+    if node_ids is not None:
+        nodes = {node_id: value for node_id, value in nodes.items() if node_id in node_ids}
+        existing_nodes = existing_nodes.filter(node_id__in=node_ids)
+    if edge_ids is not None:
+        edges = {edge_id: value for edge_id, value in edges.items() if edge_id in edge_ids}
+        existing_edges = existing_edges.filter(edge_id__in=edge_ids)
+    task_ids = {task_id for task_id, _ in nodes.values() if task_id is not None}
+    # 他のユーザーのタスクには紐付けない
+    owned_task_ids = set(Task.objects.filter(user_id=user_id, id__in=task_ids).values_list('id', flat=True)) if task_ids else set()
+
+    # 同期するidがなければ読み込まない
+    existing_nodes = {node.node_id: node for node in existing_nodes} if node_ids is None or node_ids else {}
+    new_nodes, changed_nodes = [], []
+    for node_id, (task_id, data) in nodes.items():
+        task_id = task_id if task_id in owned_task_ids else None
+        node = existing_nodes.pop(node_id, None)
+        if node is None:
+            new_nodes.append(TreeNode(project_id=project_id, node_id=node_id, task_id=task_id, data=data))
+        elif node.task_id != task_id or node.data != data:
+            node.task_id, node.data = task_id, data
+            changed_nodes.append(node)
+    if existing_nodes:
+        TreeNode.objects.filter(id__in=[node.id for node in existing_nodes.values()]).delete()
+    TreeNode.objects.bulk_create(new_nodes)
+    TreeNode.objects.bulk_update(changed_nodes, ['task', 'data'])
+
+    existing_edges = {edge.edge_id: edge for edge in existing_edges} if edge_ids is None or edge_ids else {}
+    new_edges, changed_edges = [], []
+    for edge_id, (source, target, data) in edges.items():
+        edge = existing_edges.pop(edge_id, None)
+        if edge is None:
+            new_edges.append(TreeEdge(project_id=project_id, edge_id=edge_id, source=source, target=target, data=data))
+        elif (edge.source, edge.target, edge.data) != (source, target, data):
+            edge.source, edge.target, edge.data = source, target, data
+            changed_edges.append(edge)
+    if existing_edges:
+        TreeEdge.objects.filter(id__in=[edge.id for edge in existing_edges.values()]).delete()
+    TreeEdge.objects.bulk_create(new_edges)
+    TreeEdge.objects.bulk_update(changed_edges, ['source', 'target', 'data'])
+
+
+def reachable_nodes(project_id, root, depth=MAX_TREE_DEPTH, direction='down'):
+    """
+    rootから辿れるノードを再帰CTEで取得する
+    direction: 'down' ならsource→targetの向きだけ（部分木）、'both' なら両方向（近傍）
+    戻り値: [(node_id, rootからの深さ)]
+    行数がMAX_TREE_ROWSに達したら探索を打ち切る（幅優先で辿るので、浅いノードの深さは正しいまま）
+    """
+    if direction == 'both':
+        next_node = 'CASE WHEN e.source = r.node_id THEN e.target ELSE e.source END'
+        join = '(e.source = r.node_id OR e.target = r.node_id)'
+    else:
+        next_node = 'e.target'
+        join = 'e.source = r.node_id'
+    # SQLiteは再帰部分のLIMITで、PostgreSQLは外側のLIMITで（必要な行だけ評価するので）再帰が止まる
+    inner_limit, outer_limit = ('LIMIT %s', '') if connection.vendor == 'sqlite' else ('', 'LIMIT %s')
+    sql = f"""
+        WITH RECURSIVE reachable(node_id, depth) AS (
+            SELECT CAST(%s AS VARCHAR(255)), 0
+            UNION
+            SELECT {next_node}, r.depth + 1
+            FROM {TreeEdge._meta.db_table} e JOIN reachable r ON {join}
+            WHERE e.project_id = %s AND r.depth < %s
+            {inner_limit}
+        )
+        SELECT node_id, MIN(depth) FROM (SELECT node_id, depth FROM reachable {outer_limit}) visited
+        GROUP BY node_id ORDER BY MIN(depth), node_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [str(root), project_id, min(depth, MAX_TREE_DEPTH), MAX_TREE_ROWS])
+        return cursor.fetchall()
@@ -1,29 +1,220 @@
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
-from .models import Project, Tab, Task
+from .models import STATUS_BY_LABEL, Project, Tab, Task, TaskStat, TreeChange, TreeEdge, TreeNode
 from django.contrib.auth.models import User
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Prefetch
 from .serializers import ProjectSerializer, TabSerializer, TaskSerializer, UserSerializer
 from django.utils import timezone
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .notifications import scheduler
+from .signals import send_bulk_post_save
+from .jsonpatch import JsonPatchError
+from .tree import MAX_TREE_DEPTH, apply_tree_patch, reachable_nodes, sync_tree
+from .mail import queue_mail
+from .analytics import batch_updates, summarize
+from .search import batch_index, search_task_ids, search_terms
+from .export import async_chunks, buffered, csv_lines, export_records, gzipped, ndjson_lines
+from .importer import TaskImporter, read_lines
+from .sync import MAX_PAGE_SIZE, PAGE_SIZE, CursorError, CursorExpired, batch_tombstones, changes_since, decode_cursor
+from .metrics import registry
+from .caching import bump_project_version, bump_user_version, get_project_version, get_user_version
+from .async_views import AsyncReadMixin
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.utils.dateparse import parse_date, parse_datetime
+import datetime
+import gzip
+import hashlib
+import asyncio
+import json
 import os
+import time
+
+
+# JSONやURLで送られてきたidを数値に変換する（不正な値はNone）
+def to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# モデルの実カラムに存在するフィールド名だけを返す（.only()に渡す用）
+def column_names(model, names):
+    columns = {field.name for field in model._meta.concrete_fields}
+    return [name for name in names if name in columns]
+
+
+# ネストされたTaskSerializer用のプリフェッチ（N+1クエリを防ぐ）
+# related_fieldはプリフェッチの紐付けに使う外部キー（fields指定時も必ず読み込む）
+def task_prefetch(user, fields=None, related_field='project'):
+    queryset = Task.objects.filter(user=user).order_by('id')
+    if fields:
+        queryset = queryset.only(*column_names(Task, {'id', related_field, *fields}))
+    return Prefetch('tasks', queryset=queryset)
+
+
+class SparseFieldsMixin:
+    """
+    GETリクエストで返すフィールドを絞り込む
+    - ?fields=id,name,tasks.id,tasks.title : 返すフィールド（ドット区切りでネスト先を指定）
+    - ?expand=tasks : ネストしたタスク一覧を含める（指定しなければ含めない）
+    - ?expand=summary : タスク数・作業時間の合計を含める
+    指定されたカラムだけを.only()で読み込む
+    """
+
+    def is_read_request(self):
+        return self.request.method in SAFE_METHODS
+
+    def get_field_selection(self):
+        if not hasattr(self, '_field_selection'):
+            fields, nested_fields = None, {}
+            value = self.request.query_params.get('fields')
+            if value:
+                fields = set()
+                for name in filter(None, (name.strip() for name in value.split(','))):
+                    parent, _, child = name.partition('.')
+                    if child:
+                        nested_fields.setdefault(parent, set()).add(child)
+                    else:
+                        fields.add(name)
+            expand = {name.strip() for name in self.request.query_params.get('expand', '').split(',') if name.strip()}
+            # tasks.xxx のようにネスト先を指定した場合は展開する
+            expand |= set(nested_fields)
+            self._field_selection = (fields, nested_fields, expand)
+        return self._field_selection
+
+    def is_expanded(self, name):
+        return not self.is_read_request() or name in self.get_field_selection()[2]
+
+    def get_nested_fields(self, name):
+        if not self.is_read_request():
+            return None
+        return self.get_field_selection()[1].get(name)
+
+    def select_columns(self, queryset):
+        if not self.is_read_request():
+            return queryset
+        fields = self.get_field_selection()[0]
+        if fields is None:
+            return queryset
+        return queryset.only(*column_names(queryset.model, {'id', *fields}))
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_read_request():
+            fields, nested_fields, expand = self.get_field_selection()
+            kwargs.update(fields=fields, nested_fields=nested_fields, expand=expand)
+        return super().get_serializer(*args, **kwargs)
+
+
+class CachedListMixin:
+    """
+    一覧のレスポンスをユーザー毎のデータのバージョンとURLでキャッシュする
+    ETag / Last-Modifiedが一致すればDBにもシリアライザにも触れずに304を返す
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+        headers, key, response = self.get_cached_list(request)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return self.finalize_cached_list(response, headers)
+
+    async def async_list(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return await super().async_list(request, *args, **kwargs)
+        headers, key, response = await sync_to_async(self.get_cached_list)(request)
+        if response is None:
+            response = await super().async_list(request, *args, **kwargs)
+            await cache.aset(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return self.finalize_cached_list(response, headers)
+
+    def get_cached_list(self, request, version=None):
+        """
+        戻り値: (レスポンスヘッダー, キャッシュのキー, 304またはキャッシュから作ったレスポンス)
+        キャッシュになければレスポンスはNone
+        versionを省略するとユーザーのデータのバージョンを使う
+        """
+        if version is None:
+            version = get_user_version(request.user.id)
+        digest = hashlib.md5(f'{request.user.id}:{version}:{request.build_absolute_uri()}'.encode()).hexdigest()
+        etag = f'"{digest}"'
+        last_modified = version // 10 ** 9
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        # HTTPの日時は秒単位なので、バージョンと同じ秒の間は同じ秒のうちの変更と区別できない
+        # その秒が過ぎるまではLast-Modifiedを返さず、If-Modified-Sinceでは304にしない
+        settled = last_modified < int(time.time())
+        if settled:
+            headers['Last-Modified'] = http_date(last_modified)
+        key = f'todo:list:{digest}'
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            not_modified = '*' in etags or etag in etags or f'W/{etag}' in etags
+        else:
+            if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+            not_modified = settled and if_modified_since is not None and last_modified <= if_modified_since
+        if not_modified:
+            return headers, key, Response(status=status.HTTP_304_NOT_MODIFIED)
+        data = cache.get(key)
+        return headers, key, None if data is None else Response(data)
+
+    def finalize_cached_list(self, response, headers):
+        for name, value in headers.items():
+            response[name] = value
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
-class ProjectViewSet(viewsets.ModelViewSet):
+
+class ProjectViewSet(CachedListMixin, AsyncReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Project.objects.filter(user=self.request.user)
+        queryset = self.select_columns(Project.objects.filter(user=self.request.user))
+        if self.is_expanded('tasks'):
+            # tasksを1クエリでまとめて取得する
+            queryset = queryset.prefetch_related(task_prefetch(self.request.user, self.get_nested_fields('tasks')))
+        if self.is_expanded('summary'):
+            queryset = queryset.prefetch_related('task_counters')
+        return queryset
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            project = serializer.save(user=self.request.user)
+            sync_tree(project.id, project.user_id, project.tree_data)
+
+    def perform_update(self, serializer):
+        if 'tree_data' not in serializer.validated_data:
+            serializer.save()
+            return
+        # ツリー全体が置き換わるのでバージョンを上げて差分履歴を削除
+        with transaction.atomic():
+            project = serializer.save(tree_version=serializer.instance.tree_version + 1)
+            project.tree_changes.all().delete()
+            sync_tree(project.id, project.user_id, project.tree_data)
 
     # tabの外部キーにprojectを設定してあるし、カスケードしてあるからこの処理は不要
     # def perform_destroy(self, instance):
@@ -31,15 +222,155 @@ class ProjectViewSet(viewsets.ModelViewSet):
     #     instance.tabs.all().delete()
     #     instance.delete()
 
+    # CASCADEで削除されるタスクの集計・索引の更新と削除の記録はまとめて行う
+    def perform_destroy(self, instance):
+        with transaction.atomic(), batch_updates(), batch_index(), batch_tombstones():
+            instance.delete()
+
+    # 差分履歴をプロジェクト毎に何件まで残すか（それより古いバージョンからはツリー全体を返す）
+    tree_change_log_size = 200
+
+    def get_user_projects(self, pk):
+        return Project.objects.filter(user=self.request.user, pk=to_id(pk))
+
     # プロジェクトツリーを保存するエンドポイント
     @action(detail=True, methods=['post'])
     def save_tree(self, request, pk=None):
-        project = self.get_object()
-        project.tree_data = request.data  # nodes と edges を含むJSONデータを保存
-        project.save()
-        return Response({'status': 'ツリーが保存されました'}, status=status.HTTP_200_OK)
+        projects = self.get_user_projects(pk)
+        with transaction.atomic():
+            # 行を読み込まずにnodes と edges を含むJSONデータを保存
+            if not projects.update(tree_data=request.data, tree_version=F('tree_version') + 1, updated_at=timezone.now()):
+                raise Http404
+            version = projects.values_list('tree_version', flat=True).get()
+            # ツリー全体を置き換えたので差分履歴は使えない
+            TreeChange.objects.filter(project_id=to_id(pk)).delete()
+            sync_tree(to_id(pk), request.user.id, request.data)
+            # update()はシグナルを送らないので一覧・ボードのキャッシュを手動で無効にする
+            bump_user_version(request.user.id)
+            bump_project_version(to_id(pk))
+        return Response({'status': 'ツリーが保存されました', 'version': version}, status=status.HTTP_200_OK)
+
+    # ボードの表示に必要なプロジェクト・タブ・タスクを1回で返す（それぞれ1クエリ、計3クエリ）
+    # タスクはタブのid毎にまとめる（タブのないタスクは"none"）
+    # プロジェクト毎のバージョンでキャッシュし、ETag / Last-Modifiedが一致すれば304を返す
+    @action(detail=True, methods=['get'])
+    def board(self, request, pk=None):
+        project_id = to_id(pk)
+        if project_id is None:
+            raise Http404
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return Response(self.get_board(project_id))
+        # 304（If-None-Match: * 等）を返す前に自分のプロジェクトか確認する
+        if not self.get_user_projects(project_id).exists():
+            raise Http404
+        headers, key, response = self.get_cached_list(request, get_project_version(project_id))
+        if response is None:
+            response = Response(self.get_board(project_id))
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return self.finalize_cached_list(response, headers)
+
+    def get_board(self, project_id):
+        project = self.get_user_projects(project_id).first()
+        if project is None:
+            raise Http404
+        tabs = list(Tab.objects.filter(project=project).order_by('id'))
+        serializer = TaskSerializer()
+        tasks = {str(tab.id): [] for tab in tabs}
+        rows = Task.objects.filter(user=self.request.user, project=project).order_by('id').values(*serializer.row_columns())
+        for row in rows:
+            tasks.setdefault(str(row['tab_id']) if row['tab_id'] is not None else 'none', []).append(serializer.to_representation(row))
+        return {
+            'project': ProjectSerializer(project, expand=()).data,
+            'tabs': TabSerializer(tabs, many=True, expand=()).data,
+            'tasks': tasks,
+        }
+
+    # tree_dataの差分更新・差分取得
+    # PATCH {"version": 3, "operations": [JSON Patch]} : versionが現在と一致すれば適用（不一致なら409）
+    # GET ?since=3 : version 3以降の差分（履歴が残っていなければツリー全体）
+    @action(detail=True, methods=['get', 'patch'], url_path='tree-patch')
+    def tree_patch(self, request, pk=None):
+        projects = self.get_user_projects(pk)
+        if request.method == 'GET':
+            return self.get_tree_changes(projects, to_id(request.query_params.get('since')))
+
+        version = to_id(request.data.get('version'))
+        if version is None:
+            return Response({'version': ['バージョンは必須です。']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            project = projects.values('id', 'tree_data', 'tree_version').get()
+        except Project.DoesNotExist:
+            raise Http404
+        if project['tree_version'] != version:
+            return Response({'detail': 'ツリーが他で更新されています。', 'version': project['tree_version']}, status=status.HTTP_409_CONFLICT)
+
+        operations = request.data.get('operations')
+        try:
+            tree_data, node_ids, edge_ids = apply_tree_patch(project['tree_data'], operations)
+        except JsonPatchError as e:
+            return Response({'operations': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # 読み込んでから更新するまでに他で更新されていたら何もしない
+            if not projects.filter(tree_version=version).update(
+                    tree_data=tree_data, tree_version=version + 1, updated_at=timezone.now()):
+                return Response({'detail': 'ツリーが他で更新されています。'}, status=status.HTTP_409_CONFLICT)
+            TreeChange.objects.create(project_id=project['id'], version=version + 1, operations=operations)
+            TreeChange.objects.filter(project_id=project['id'], version__lte=version + 1 - self.tree_change_log_size).delete()
+            # 操作が書き換えたノード・エッジの行だけを同期する
+            sync_tree(project['id'], request.user.id, tree_data, node_ids, edge_ids)
+            bump_user_version(request.user.id)
+            bump_project_version(project['id'])
+        return Response({'version': version + 1}, status=status.HTTP_200_OK)
+
+    def get_tree_changes(self, projects, since):
+        try:
+            project = projects.values('id', 'tree_version').get()
+        except Project.DoesNotExist:
+            raise Http404
+        if since is None or not 0 <= since <= project['tree_version']:
+            return Response({'since': ['バージョンが不正です。']}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = list(TreeChange.objects.filter(project_id=project['id'], version__gt=since)
+                       .order_by('version').values('version', 'operations'))
+        if len(changes) == project['tree_version'] - since:
+            return Response({'version': project['tree_version'], 'changes': changes})
+        # 履歴が削除済みの場合はツリー全体を返す
+        tree = projects.values('tree_data', 'tree_version').get()
+        return Response({'version': tree['tree_version'], 'tree_data': tree['tree_data']})
+
+    # tree_dataを読み込まずにノード・エッジを検索する
+    # ?task=<id> : タスクに紐付いたノード
+    # ?root=<node_id>&depth=<n> : rootの部分木（&direction=both なら前後両方向の近傍）
+    @action(detail=True, methods=['get'], url_path='tree-nodes')
+    def tree_nodes(self, request, pk=None):
+        project_id = self.get_user_projects(pk).values_list('id', flat=True).first()
+        if project_id is None:
+            raise Http404
+        nodes = TreeNode.objects.filter(project_id=project_id)
+
+        task_id = request.query_params.get('task')
+        root = request.query_params.get('root')
+        if task_id is not None:
+            nodes = nodes.filter(task_id=to_id(task_id)).order_by('id')
+            return Response({'nodes': [node.data for node in nodes]})
+        if root is None:
+            return Response({'detail': 'taskかrootを指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        depth = to_id(request.query_params.get('depth', MAX_TREE_DEPTH))
+        if depth is None or depth < 0:
+            return Response({'depth': ['深さが不正です。']}, status=status.HTTP_400_BAD_REQUEST)
+        direction = 'both' if request.query_params.get('direction') == 'both' else 'down'
+        depths = dict(reachable_nodes(project_id, root, depth, direction))
+        nodes = sorted(nodes.filter(node_id__in=depths), key=lambda node: (depths[node.node_id], node.node_id))
+        edges = TreeEdge.objects.filter(project_id=project_id, source__in=depths, target__in=depths).order_by('id')
+        return Response({
+            'nodes': [node.data for node in nodes],
+            'edges': [edge.data for edge in edges],
+            'depths': {node.node_id: depths[node.node_id] for node in nodes},  # rootからの深さ
+        })
     
-class TabViewSet(viewsets.ModelViewSet):
+class TabViewSet(CachedListMixin, AsyncReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Tab.objects.all()
     serializer_class = TabSerializer
     permission_classes = [IsAuthenticated]
@@ -48,9 +379,15 @@ class TabViewSet(viewsets.ModelViewSet):
     # if文がおそらく冗長（return Project.objects.filter(user=self.request.user)こんな感じでいけるはず）
     def get_queryset(self):
         project = self.request.query_params.get('project', None)
+        # projectを指定しない場合もユーザーのタブだけにする
+        queryset = self.select_columns(Tab.objects.filter(project__user=self.request.user))
+        if self.is_expanded('tasks'):
+            queryset = queryset.prefetch_related(task_prefetch(self.request.user, self.get_nested_fields('tasks'), 'tab'))
+        if self.is_expanded('summary'):
+            queryset = queryset.prefetch_related('task_counters')
         if project:
-            return Tab.objects.filter(project__id=project)
-        return super().get_queryset()
+            return queryset.filter(project__id=project)
+        return queryset
     
     # リクエストボディにprojectは入っているし、シリアライザに設定もしてあるからこの処理は不要
     # def perform_create(self, serializer):
@@ -70,14 +407,37 @@ class TabViewSet(viewsets.ModelViewSet):
     #     instance.tasks.all().delete()
     #     instance.delete()
 
-class TaskViewSet(viewsets.ModelViewSet):
+    # CASCADEで削除されるタスクの集計・索引の更新と削除の記録はまとめて行う
+    def perform_destroy(self, instance):
+        with transaction.atomic(), batch_updates(), batch_index(), batch_tombstones():
+            instance.delete()
+
+# 一括操作でシリアライザに検証させるフィールド（project/tabはまとめて取得したものから設定する）
+BULK_TASK_FIELDS = set(TaskSerializer.Meta.fields) - {'id', 'project', 'tab'}
+
+
+class TaskViewSet(CachedListMixin, AsyncReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # 現在ログインしているユーザーのタスクのみを返す
-        return Task.objects.filter(user=self.request.user)
+        queryset = Task.objects.filter(user=self.request.user)
+        # ?project= / ?tab= / ?status= で絞り込み
+        params = self.request.query_params
+        if params.get('project'):
+            queryset = queryset.filter(project_id=to_id(params['project']))
+        if params.get('tab'):
+            queryset = queryset.filter(tab_id=to_id(params['tab']))
+        if params.get('status'):
+            # ステータスは表示名（'未着手'など）で指定する。知らない表示名は該当なし
+            status_code = STATUS_BY_LABEL.get(params['status'])
+            queryset = queryset.filter(status=status_code) if status_code is not None else queryset.none()
+        if self.is_read_request() and self.action in ('list', 'retrieve'):
+            # 一覧・詳細はモデルのインスタンスを作らず、.values()の行から直接シリアライズする
+            return queryset.values(*self.get_serializer().row_columns())
+        return self.select_columns(queryset)
 
     def perform_create(self, serializer):
         # POSTデータからproject_idとtab_idを取得し、適切に外部キーを設定する
@@ -103,9 +463,136 @@ class TaskViewSet(viewsets.ModelViewSet):
         # タスクを保存し、user, project, tabを設定
         serializer.save(user=self.request.user, project=project, tab=tab)
 
+    # タイトル・背景・目的・詳細説明・コメントの全文検索（関連度の高い順）
+    # ?q=<検索語>&page_size=<件数>&offset=<位置> （?fields= も使える）
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response({'q': ['検索語を指定してください。']}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = self.paginator.get_page_size(request)
+        offset = max(to_id(request.query_params.get('offset')) or 0, 0)
+
+        # 次のページがあるか判定するため1件多く取得する
+        task_ids = search_task_ids(request.user.id, query, page_size + 1, offset)
+        tasks = self.select_columns(Task.objects.filter(user=request.user, id__in=task_ids[:page_size])).in_bulk()
+        serializer = self.get_serializer([tasks[task_id] for task_id in task_ids[:page_size] if task_id in tasks], many=True)
+
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'offset', offset + page_size) if len(task_ids) > page_size else None,
+            'previous': replace_query_param(url, 'offset', max(offset - page_size, 0)) if offset > 0 else None,
+            'results': serializer.data,
+        })
+
+    # 1件分のデータを検証し、(保存する値, エラー) を返す
+    def validate_bulk_item(self, item, projects, tabs, partial):
+        if not isinstance(item, dict):
+            return None, {'non_field_errors': ['オブジェクトで指定してください。']}
+        data = {key: value for key, value in item.items() if key not in ('id', 'project', 'tab')}
+        values, errors = {}, {}
+
+        if 'project' in item or not partial:
+            project = projects.get(to_id(item.get('project')))
+            if project is None:
+                errors['project'] = ['プロジェクトが見つかりません。']
+            values['project'] = project
+        if item.get('tab') is not None:
+            tab = tabs.get(to_id(item['tab']))
+            if tab is None:
+                errors['tab'] = ['タブが見つかりません。']
+            values['tab'] = tab
+        elif 'tab' in item:
+            values['tab'] = None
+
+        serializer = TaskSerializer(data=data, partial=partial, fields=BULK_TASK_FIELDS)
+        if not serializer.is_valid():
+            errors.update(serializer.errors)
+        if errors:
+            return None, errors
+        values.update(serializer.validated_data)
+        return values, None
+
+    # 複数タスクの作成・部分更新・削除を1トランザクションで行う
+    # {"create": [{...}], "update": [{"id": 1, ...}], "delete": [1, 2]}
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        payload = {key: request.data.get(key) or [] for key in ('create', 'update', 'delete')}
+        if not all(isinstance(items, list) for items in payload.values()):
+            return Response({'detail': 'create, update, deleteはリストで指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        creates, updates, deletes = payload['create'], payload['update'], payload['delete']
+
+        # 参照されているプロジェクト・タブ・タスクをモデル毎に1クエリで取得（他ユーザーのものは含まれない）
+        items = [item for item in creates + updates if isinstance(item, dict)]
+        project_ids = {to_id(item.get('project')) for item in items} - {None}
+        tab_ids = {to_id(item.get('tab')) for item in items} - {None}
+        task_ids = {to_id(item.get('id')) for item in updates if isinstance(item, dict)} | {to_id(task_id) for task_id in deletes}
+        task_ids.discard(None)
+        projects = Project.objects.filter(user=request.user).in_bulk(project_ids) if project_ids else {}
+        tabs = Tab.objects.filter(project__user=request.user).in_bulk(tab_ids) if tab_ids else {}
+        tasks = Task.objects.filter(user=request.user).in_bulk(task_ids) if task_ids else {}
+
+        results = {'create': [], 'update': [], 'delete': []}
+        new_tasks, changed_tasks, deleted_ids, update_fields = [], [], [], set()
+        for item in creates:
+            values, errors = self.validate_bulk_item(item, projects, tabs, partial=False)
+            if errors:
+                results['create'].append({'status': status.HTTP_400_BAD_REQUEST, 'errors': errors})
+                continue
+            new_tasks.append(Task(user=request.user, **values))
+            results['create'].append(None)
+        for item in updates:
+            task = tasks.get(to_id(item.get('id'))) if isinstance(item, dict) else None
+            if task is None:
+                results['update'].append({'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ['タスクが見つかりません。']}})
+                continue
+            values, errors = self.validate_bulk_item(item, projects, tabs, partial=True)
+            if errors:
+                results['update'].append({'status': status.HTTP_400_BAD_REQUEST, 'errors': errors})
+                continue
+            for field, value in values.items():
+                setattr(task, field, value)
+            update_fields.update(values)
+            changed_tasks.append(task)
+            results['update'].append(None)
+        for task_id in deletes:
+            if to_id(task_id) not in tasks:
+                results['delete'].append({'status': status.HTTP_404_NOT_FOUND, 'id': task_id})
+                continue
+            deleted_ids.append(to_id(task_id))
+            results['delete'].append({'status': status.HTTP_204_NO_CONTENT, 'id': to_id(task_id)})
+
+        # 1件でもエラーがあれば何も保存しない（エラーのない項目は424を返す）
+        if any(result is not None and result['status'] >= 400 for kind in results.values() for result in kind):
+            for kind, kind_results in results.items():
+                results[kind] = [
+                    result if result is not None and result['status'] >= 400 else {'status': status.HTTP_424_FAILED_DEPENDENCY}
+                    for result in kind_results
+                ]
+            return Response(results, status=status.HTTP_400_BAD_REQUEST)
+
+        # 集計（TaskStat / TaskCounter）と全文検索の索引の更新、削除の記録はタスク毎ではなくまとめて行う
+        with transaction.atomic(), batch_updates(), batch_index(), batch_tombstones():
+            if new_tasks:
+                Task.objects.bulk_create(new_tasks)
+                send_bulk_post_save(Task, new_tasks, created=True)
+            if changed_tasks and update_fields:
+                # bulk_updateではauto_nowが設定されないので手動で更新日時を入れる
+                now = timezone.now()
+                for task in changed_tasks:
+                    task.updated_at = now
+                Task.objects.bulk_update(changed_tasks, [*update_fields, 'updated_at'])
+                send_bulk_post_save(Task, changed_tasks, created=False, update_fields=update_fields)
+            if deleted_ids:
+                Task.objects.filter(user=request.user, id__in=deleted_ids).delete()
+
+        results['create'] = [{'status': status.HTTP_201_CREATED, 'data': TaskSerializer(task).data} for task in new_tasks]
+        results['update'] = [{'status': status.HTTP_200_OK, 'data': TaskSerializer(task).data} for task in changed_tasks]
+        return Response(results, status=status.HTTP_200_OK)
+
 # この機能もおそらく不要（フロントエンドで時間を管理している）
 # 通知用のタスク取得ビュー
-class TaskNotificationView(APIView):
+class TaskNotificationView(AsyncReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
@@ -123,6 +610,222 @@ class TaskNotificationView(APIView):
             "tasks": list(tasks.values("id", "title", "scheduled_start_time"))
         })
 
+    async def async_get(self, request, format=None):
+        now = timezone.now()
+        tasks = Task.objects.filter(
+            user=request.user,
+            scheduled_start_time__gte=now,
+            scheduled_start_time__lte=now + timezone.timedelta(minutes=1)
+        )
+        return Response({
+            "tasks": [task async for task in tasks.values("id", "title", "scheduled_start_time")]
+        })
+
+
+# 生産性の集計（TaskStatから計算するのでタスク数ではなく日数分の行しか読まない）
+# ?project=<id> : プロジェクトで絞り込み
+# ?from=YYYY-MM-DD&to=YYYY-MM-DD : 期間で絞り込み（指定すると日付のないタスクは含まない）
+class AnalyticsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        stats = TaskStat.objects.filter(user=request.user)
+        params = request.query_params
+        if params.get('project'):
+            stats = stats.filter(project_id=to_id(params['project']))
+
+        errors = {}
+        for param, lookup in (('from', 'day__gte'), ('to', 'day__lte')):
+            if not params.get(param):
+                continue
+            try:
+                day = parse_date(params[param])
+            except ValueError:
+                day = None
+            if day is None:
+                errors[param] = ['日付はYYYY-MM-DDの形式で指定してください。']
+                continue
+            stats = stats.filter(**{lookup: day})
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'totals': summarize(stats),
+            'days': summarize(stats.filter(day__isnull=False), 'day'),
+            'projects': summarize(stats, 'project'),
+            'difficulties': summarize(stats, 'difficulty'),
+        })
+
+
+# プロジェクト・タブ・タスクのエクスポート（バックアップ・移行用）
+# ?output=ndjson（既定）/ csv : 出力形式
+# ?updated_since=<ISO 8601の日時または日付> : それ以降に更新されたものだけ（差分エクスポート）
+# Accept-Encoding: gzip ならgzipで圧縮しながら送る
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response({'output': ['ndjsonまたはcsvを指定してください。']}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated_since = None
+        if request.query_params.get('updated_since'):
+            value = request.query_params['updated_since']
+            try:
+                updated_since = parse_datetime(value) or parse_date(value)
+            except ValueError:
+                updated_since = None
+            if updated_since is None:
+                return Response({'updated_since': ['日時はISO 8601の形式で指定してください。']}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(updated_since, datetime.datetime):
+                updated_since = datetime.datetime.combine(updated_since, datetime.time())
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+
+        records = export_records(request.user, updated_since)
+        if output == 'csv':
+            content = buffered(csv_lines(records))
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            content = buffered(ndjson_lines(records))
+            content_type = 'application/x-ndjson'
+
+        use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        if use_gzip:
+            content = gzipped(content)
+        # ASGIでは非同期のイテレーターにする（同期のままだと全体をメモリに読み込んでから送られる）
+        if isinstance(request._request, ASGIRequest):
+            content = async_chunks(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response['Content-Disposition'] = f'attachment; filename="todo-export.{output}"'
+        return response
+
+
+# エクスポートしたNDJSON（/api/export/）の取り込み
+# リクエストボディを1行ずつ読み、プロジェクト・タブ・タスクをまとめて作成する（Content-Encoding: gzipにも対応）
+# 不正な行は読み飛ばし、行番号とエラーを返す
+class ImportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        stream = request.stream
+        if stream is None:
+            return Response({'detail': 'NDJSONを送信してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream)
+        importer = TaskImporter(request.user)
+        try:
+            result = importer.run(read_lines(stream))
+        except (OSError, EOFError):
+            # gzipとして読み込めない場合（それまでに保存したチャンクの件数も返す）
+            return Response({'detail': 'gzipとして読み込めません。', **importer.result()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+# 差分同期（前回の同期より後に作成・変更・削除されたプロジェクト・タブ・タスクだけを返す）
+# ?since=<前回のnext_cursor>（省略すると全件）&limit=<件数>
+# has_moreがtrueの間はnext_cursorで続きを取得し、falseになったらnext_cursorを次回の同期まで保存する
+class SyncView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        cursor, initial = None, False
+        if request.query_params.get('since'):
+            try:
+                cursor, initial = decode_cursor(request.query_params['since'])
+            except CursorError:
+                return Response({'since': ['カーソルが不正です。']}, status=status.HTTP_400_BAD_REQUEST)
+        limit = to_id(request.query_params.get('limit', PAGE_SIZE))
+        if limit is None or limit < 1:
+            return Response({'limit': ['1以上の整数を指定してください。']}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            changes, next_cursor, has_more = changes_since(request.user, cursor, min(limit, MAX_PAGE_SIZE), initial=initial)
+        except CursorExpired:
+            return Response(
+                {'detail': 'カーソルの期限が切れています。sinceを指定せずに全件を同期してください。'}, status=status.HTTP_410_GONE,
+            )
+        return Response({'changes': changes, 'next_cursor': next_cursor, 'has_more': has_more})
+
+
+# ロードバランサーなどからのヘルスチェック（DBに接続できるか）
+class HealthCheckView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, format=None):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return Response({'status': 'ng'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'status': 'ok'})
+
+
+# Server-Sent Eventsの接続を維持するためのコメント送信間隔（秒）
+EVENT_STREAM_KEEPALIVE = 15
+
+
+# トークンの署名と有効期限だけを検証してユーザーIDを取り出す（DBアクセスなし）
+# EventSourceはヘッダーを付けられないので ?token= でも受け付ける
+def get_token_user_id(request):
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+# TaskNotificationViewのポーリングを置き換えるタスク開始通知のストリーム
+# ASGI（asgi.py）で動かす必要がある（WSGIではレスポンスが返らない）
+async def task_event_stream(request):
+    user_id = get_token_user_id(request)
+    if user_id is None:
+        return JsonResponse({'detail': '認証情報が正しくありません。'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    scheduler.start()
+
+    async def events():
+        scheduler.subscribe(user_id, queue, loop)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: task_starting\ndata: {json.dumps(event, cls=JSONEncoder)}\n\n'
+        finally:
+            scheduler.unsubscribe(user_id, queue, loop)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Prometheus用のリクエストの計測値（todo.middleware.RequestMetricsMiddlewareが集計したもの）
+def metrics_view(request):
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ユーザー管理用のビュー
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -147,7 +850,7 @@ class UserViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # 現在ログインしているユーザーの情報のみを返す
-        return User.objects.filter(username=self.request.user)
+        return User.objects.filter(id=self.request.user.id)
     
     # パスワード変更用のアクション
     @action(detail=False, methods=['patch'], permission_classes=[IsAuthenticated], url_path='change-password')
@@ -190,8 +893,8 @@ class UserViewSet(viewsets.ModelViewSet):
         # リセットリンクの作成（フロントエンドのパスワードリセットページのURLを設定）
         reset_url = f"{os.environ["FRONTEND_URL"]}/password-reset-confirm?uid={uid}&token={token}"
 
-        # メール送信
-        send_mail(
+        # メールを送信待ちにする（送信はバックグラウンドで行う）
+        queue_mail(
             subject='パスワードリセットのリクエスト',
             message=f'以下のリンクからパスワードの再設定を行ってください: {reset_url}',
             from_email='no-reply@example.com',
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo_practice1.settings')
 
 application = get_asgi_application()
+
+# タスク開始通知（/api/task-events/ のServer-Sent Events）のスケジューラを起動
+from todo.notifications import scheduler  # noqa: E402
+
+scheduler.start()
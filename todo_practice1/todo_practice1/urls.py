@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from todo.views import ProjectViewSet, TabViewSet, TaskViewSet, UserViewSet, TaskNotificationView
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from todo.views import ProjectViewSet, TabViewSet, TaskViewSet, UserViewSet, TaskNotificationView, task_event_stream, HealthCheckView, AnalyticsView, ExportView, ImportView, SyncView, metrics_view
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView, TokenRefreshView
 
 router = DefaultRouter()
 router.register(r'projects', ProjectViewSet)
@@ -15,6 +15,14 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/task-notifications/', TaskNotificationView.as_view(), name='task-notifications'),
+    path('api/analytics/', AnalyticsView.as_view(), name='analytics'),  # タスクの集計（ダッシュボード用）
+    path('api/export/', ExportView.as_view(), name='export'),  # プロジェクト・タブ・タスクのエクスポート（NDJSON / CSV）
+    path('api/import/', ImportView.as_view(), name='import'),  # エクスポートしたNDJSONの取り込み
+    path('api/sync/', SyncView.as_view(), name='sync'),  # 前回の同期より後の変更・削除だけを返す差分同期
+    path('api/health/', HealthCheckView.as_view(), name='health'),  # ヘルスチェック用エンドポイント
+    path('api/task-events/', task_event_stream, name='task-events'),  # タスク開始通知（Server-Sent Events）
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),  # JWTトークン取得用エンドポイント
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),  # JWTトークンリフレッシュ用エンドポイント
+    path('api/token/blacklist/', TokenBlacklistView.as_view(), name='token_blacklist'),  # リフレッシュトークンの失効（ログアウト）用エンドポイント
+    path('metrics', metrics_view, name='metrics'),  # Prometheus用の計測値
 ]